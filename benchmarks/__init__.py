@@ -0,0 +1,3 @@
+""" Benchmarks for the lexer, the parser, the interpreters and the OPG engine
+Run `python -m benchmarks run` from the repository root, see benchmarks/__main__.py
+"""
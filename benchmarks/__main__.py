@@ -0,0 +1,53 @@
+""" Command line of the benchmarks, run from the repository root
+python -m benchmarks run [--preset quick|full] [--repeat N] [--engines reference,threaded] [--out FILE]
+python -m benchmarks compare OLD NEW [--threshold 0.1]
+compare exits with status 1 if any case regressed.
+"""
+from benchmarks.suite import presets, run_suite, compare
+from compiler.interpreter import engines
+import argparse
+import json
+import sys
+
+
+def print_result(key, value):
+    print('{:<50} {:>10.4f} s {:>14,.0f} {}/s {:>10.1f} MiB'.format(
+        key, value['seconds'], value['rate'], value['unit'], value['peak_bytes'] / 2**20))
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks')
+    commands = parser.add_subparsers(dest='command')
+    run = commands.add_parser('run', help='run the benchmarks')
+    run.add_argument('--preset', choices=sorted(presets), default='quick')
+    run.add_argument('--repeat', type=int, default=3)
+    run.add_argument('--engines', default=','.join(engines))
+    run.add_argument('--out', help='file to write the results to as JSON')
+    diff = commands.add_parser('compare', help='compare two results')
+    diff.add_argument('old')
+    diff.add_argument('new')
+    diff.add_argument('--threshold', type=float, default=0.1, help='allowed slowdown, 0.1 for 10%%')
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        results = run_suite(args.preset, args.repeat, args.engines.split(','), print_result)
+        if args.out:
+            with open(args.out, 'w') as f:
+                json.dump(results, f, indent=2)
+    elif args.command == 'compare':
+        with open(args.old) as f:
+            old = json.load(f)
+        with open(args.new) as f:
+            new = json.load(f)
+        rows = compare(old, new, args.threshold)
+        for key, before, after, time_ratio, memory_ratio, regressed in rows:
+            print('{:<50} {:>10.4f} s {:>10.4f} s {:>7.2f}x time {:>7.2f}x memory{}'.format(
+                key, before, after, time_ratio, memory_ratio, '  REGRESSION' if regressed else ''))
+        if any(row[-1] for row in rows):
+            sys.exit(1)
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
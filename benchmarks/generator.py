@@ -0,0 +1,77 @@
+""" Generators of large PL/0 programs for the benchmarks
+Every program terminates and reads no input. The output is deterministic, so the same parameters
+always give the same source.
+"""
+
+
+def nested_procedures(depth):
+    """ depth procedures, each declared inside the previous one and calling the next one, the
+    innermost updating a variable of every level. The main program runs the chain ten times.
+    """
+    lines = []
+    for level in range(depth):
+        lines.append('    ' * level + 'procedure p%d;' % level)
+        lines.append('    ' * level + 'var v%d;' % level)
+    updates = ''.join('v%d := v%d + %d; ' % (level, level, level) for level in range(depth))
+    lines.append('    ' * (depth-1) + 'begin %sv := v + 1 end;' % updates)
+    for level in range(depth-2, -1, -1):
+        lines.append('    ' * level + 'begin v%d := 0; call p%d end;' % (level, level+1))
+    return 'var v, n;\n%s\nbegin n := 0; while n < 10 do begin call p0; n := n + 1 end; write(v) end.\n' % \
+        '\n'.join(lines)
+
+
+def many_procedures(count):
+    """ count sibling procedures, each called once by the main program
+    """
+    procedures = ['procedure q%d;\nvar t;\nbegin t := x * %d; x := t / %d + 1 end;' % (i, i+2, i+2)
+                  for i in range(count)]
+    calls = '; '.join('call q%d' % i for i in range(count))
+    return 'var x;\n%s\nbegin x := 0; %s; write(x) end.\n' % ('\n'.join(procedures), calls)
+
+
+def long_loop(iterations):
+    """ A while loop running iterations times, with arithmetic and a condition in its body
+    """
+    return '''var i, s, t;
+begin
+    i := 0;
+    s := 0;
+    while i < %d do
+    begin
+        t := i * 3 + 7;
+        if odd t then s := s + t / 2 else s := s - 1;
+        i := i + 1
+    end;
+    write(s)
+end.
+''' % iterations
+
+
+def large_program(tokens):
+    """ A program of about tokens tokens, made of procedures with a hundred statements each
+    """
+    statement = 'a := (a * 3 + b) / 4 - c'  # 15 tokens with the separating ';', a stays small
+    statements = max(1, tokens // 15)
+    procedures = []
+    calls = []
+    for i in range(0, statements, 100):
+        count = min(100, statements - i)
+        procedures.append('procedure r%d;\nbegin\n    %s\nend;' % (i // 100, ';\n    '.join([statement] * count)))
+        calls.append('call r%d' % (i // 100))
+    return 'var a, b, c;\n%s\nbegin a := 1; b := 2; c := 3; %s; write(a) end.\n' % (
+        '\n'.join(procedures), '; '.join(calls))
+
+
+def expression(operands):
+    """ An expression of the OPG grammar E->E+T|T, T->T*F|F, F->(E)|i with operands i
+    """
+    parts = []
+    for k in range(operands):
+        if k % 5 == 0 and k + 2 < operands:
+            parts.append('(i+i)')
+        else:
+            parts.append('i')
+    text = ''
+    for k, part in enumerate(parts):
+        text += part if k == 0 else ('*' if k % 3 else '+') + part
+    return text
@@ -0,0 +1,172 @@
+from io import StringIO
+from compiler.lexer import Lexer
+from compiler.parser import Parser
+from compiler.interpreter import engines
+from toy.opg import OPGEngine
+from benchmarks import generator
+import os
+import platform
+import sys
+import time
+import timeit
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+EXPRESSION_GRAMMAR = ['E->E+T|T', 'T->T*F|F', 'F->(E)|i']
+
+# input of the programs that read
+INPUT = ['12', '18', '7', '3'] * 8
+
+# sizes of the generated programs
+presets = {
+    'quick': dict(nesting=30, procedures=300, iterations=20000, tokens=100000, operands=200),
+    'full': dict(nesting=100, procedures=3000, iterations=300000, tokens=1000000, operands=1000),
+}
+
+
+def programs(preset):
+    """ (name, source) of the programs of doc/programs and of the generated programs
+    """
+    directory = os.path.join(ROOT, 'doc', 'programs')
+    for name in sorted(os.listdir(directory)):
+        with open(os.path.join(directory, name)) as f:
+            source = f.read()
+        if source.strip():
+            yield name, source
+    sizes = presets[preset]
+    yield 'nested_procedures_%d' % sizes['nesting'], generator.nested_procedures(sizes['nesting'])
+    yield 'many_procedures_%d' % sizes['procedures'], generator.many_procedures(sizes['procedures'])
+    yield 'long_loop_%d' % sizes['iterations'], generator.long_loop(sizes['iterations'])
+    yield 'large_program_%d' % sizes['tokens'], generator.large_program(sizes['tokens'])
+
+
+def grammars(preset):
+    """ (name, rules, program) of the grammars for the OPG engine, program is None if it should not be
+    analysed
+    """
+    with open(os.path.join(ROOT, 'doc', 'og.txt')) as f:
+        yield 'og.txt', f.read().replace('\r', '').strip().split('\n'), None
+    operands = presets[preset]['operands']
+    yield 'expression_%d' % operands, EXPRESSION_GRAMMAR, generator.expression(operands)
+
+
+def measure(run, repeat):
+    """ Best time of run() over repeat samples, and its peak memory in bytes
+    Each sample runs it as many times as needed to take at least 0.2 seconds. The memory is measured
+    with tracemalloc in a run of its own, as tracing slows everything down.
+    """
+    timer = timeit.Timer(run)
+    number = timer.autorange()[0]
+    seconds = min(timer.repeat(repeat, number)) / number
+    tracemalloc.start()
+    try:
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return seconds, peak
+
+
+def result(seconds, peak, count, unit):
+    return {'seconds': seconds, 'peak_bytes': peak, 'count': count, 'unit': unit, 'rate': count / seconds}
+
+
+def bench_program(source, repeat, engine_names):
+    """ Results of lexing, parsing and running a PL/0 program, by stage
+    """
+    results = dict()
+
+    def lex():
+        lexer = Lexer()
+        lexer.load_program(source)
+        return sum(1 for token in lexer.get_symbol())
+
+    def parse():
+        parser = Parser()
+        parser.load_program(source)
+        return parser.analyze(out=StringIO(), err=StringIO())
+
+    tokens = lex()
+    results['lexer'] = result(*measure(lex, repeat), tokens, 'tokens')
+    pcodes = parse()
+    if pcodes is None:
+        return results
+    results['parser'] = result(*measure(parse, repeat), len(pcodes), 'pcodes')
+    for name in engine_names:
+        interpreter = engines[name]()
+
+        def run():
+            interpreter.in_ = INPUT
+            interpreter.interpret(pcodes, out=StringIO(), err=StringIO())
+        run()
+        results['interpreter.%s' % name] = result(*measure(run, repeat), interpreter.steps, 'instructions')
+    return results
+
+
+def bench_grammar(rules, program, repeat):
+    """ Results of building the priority table of a grammar and analysing a program with it, with
+    and without the trace, and with precedence functions if the grammar has them
+    """
+    results = dict()
+
+    def table():
+        engine = OPGEngine()
+        engine.import_rules(rules)
+        return engine, engine.calc_priority_tab(out=StringIO())
+
+    engine, is_opg = table()
+    results['opg.table'] = result(*measure(table, repeat), len(engine.rules), 'rules')
+    if is_opg and program is not None:
+        results['opg.analyse'] = result(*measure(lambda: engine.analyse(program, out=StringIO()), repeat),
+                                        len(program), 'symbols')
+        results['opg.accepts'] = result(*measure(lambda: engine.accepts(program), repeat), len(program), 'symbols')
+        if engine.calc_precedence_functions():
+            results['opg.accepts.functions'] = result(*measure(lambda: engine.accepts(program), repeat),
+                                                      len(program), 'symbols')
+    return results
+
+
+def run_suite(preset='quick', repeat=3, engine_names=('reference', 'threaded'), log=None):
+    """ Run every benchmark, returns the results as a dict that can be saved as JSON
+    Results are keyed by 'case/stage'. log is called with each key and result as they come.
+    """
+    results = dict()
+    cases = [(name, lambda source=source: bench_program(source, repeat, engine_names))
+             for name, source in programs(preset)]
+    cases += [(name, lambda rules=rules, program=program: bench_grammar(rules, program, repeat))
+              for name, rules, program in grammars(preset)]
+    for name, bench in cases:
+        for stage, value in bench().items():
+            key = '%s/%s' % (name, stage)
+            results[key] = value
+            if log:
+                log(key, value)
+    return {
+        'meta': {
+            'preset': preset,
+            'repeat': repeat,
+            'python': sys.version.split()[0],
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+        },
+        'results': results,
+    }
+
+
+def compare(old, new, threshold=0.1):
+    """ Compare two results of run_suite, returns (key, old seconds, new seconds, time ratio, memory
+    ratio, regressed) for the keys found in both. A case regressed if it became more than threshold
+    slower or bigger.
+    """
+    rows = []
+    for key, after in new['results'].items():
+        before = old['results'].get(key)
+        if before is None:
+            continue
+        time_ratio = after['seconds'] / before['seconds']
+        memory_ratio = after['peak_bytes'] / max(before['peak_bytes'], 1)
+        regressed = time_ratio > 1 + threshold or memory_ratio > 1 + threshold
+        rows.append((key, before['seconds'], after['seconds'], time_ratio, memory_ratio, regressed))
+    return rows
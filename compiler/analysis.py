@@ -0,0 +1,84 @@
+from compiler.pcode import OpCode
+
+
+class FrameLayout:
+    """ Static layout of the frames of a p-code program
+    A procedure is identified by its entry address (0 for the main program). For each reachable
+    instruction, level is the lexical level it runs at and owner the procedure it belongs to.
+    size is the frame size of each procedure (the operand of its INT) and parent its lexically
+    enclosing procedure.
+    """
+    def __init__(self, length):
+        self.level = [None] * length
+        self.owner = [None] * length
+        self.size = dict()
+        self.parent = {0: None}
+        self.entry_level = {0: 0}
+
+    def ancestor(self, procedure, level):
+        """ The procedure whose frame is found by following static links up to level
+        """
+        while self.entry_level[procedure] > level:
+            procedure = self.parent[procedure]
+        return procedure
+
+    def target(self, pc, l):
+        """ Absolute level and procedure of the frame accessed with level difference l at pc
+        Static links of the main program point to itself, so going beyond it stays at level 0
+        """
+        level = max(0, self.level[pc] - l)
+        return level, self.ancestor(self.owner[pc], level)
+
+
+def resolve_layout(pcodes):
+    """ Follow the control flow from address 0 and resolve the frame layout of the program
+    Returns None unless every (level difference, offset) pair can be resolved statically:
+    each instruction must run at a single level inside a single procedure, procedures must begin
+    with INT, and no instruction may write outside the variables of a frame, since overwriting
+    static or dynamic links would make the actual frames differ from the resolved ones.
+    """
+    layout = FrameLayout(len(pcodes))
+    todo = [(0, 0, 0)]  # (address, level, owner), jumping to 0 ends the program instead
+    while todo:
+        pc, level, owner = todo.pop()
+        while pc < len(pcodes):
+            if pc < 0:
+                return None
+            if layout.level[pc] is not None:
+                if (layout.level[pc], layout.owner[pc]) != (level, owner):
+                    return None
+                break
+            layout.level[pc], layout.owner[pc] = level, owner
+            code = pcodes[pc]
+            if code.f in (OpCode.LOD, OpCode.STO, OpCode.RED, OpCode.CAL) and code.l < 0:
+                return None
+            if code.f == OpCode.INT:
+                if owner in layout.size:
+                    return None
+                layout.size[owner] = max(code.a, 3)
+            elif owner not in layout.size and code.f != OpCode.JMP:
+                return None  # the frame is used before it is allocated
+            pc += 1
+            if code.f == OpCode.JMP:
+                pc = code.a
+            elif code.f in (OpCode.JPC, OpCode.CJP) and code.a != 0:
+                todo.append((code.a, level, owner))
+            elif code.f == OpCode.CAL and code.a != 0:
+                entry_level = max(0, level - code.l) + 1
+                parent = layout.ancestor(owner, entry_level-1)
+                if layout.entry_level.setdefault(code.a, entry_level) != entry_level or \
+                        layout.parent.setdefault(code.a, parent) != parent:
+                    return None
+                todo.append((code.a, entry_level, code.a))
+            elif code.f == OpCode.OPR and code.a == 0:
+                break
+            if pc == 0:
+                break
+
+    for pc, code in enumerate(pcodes):
+        if layout.level[pc] is None or code.f not in (OpCode.LOD, OpCode.STO, OpCode.RED):
+            continue
+        level, procedure = layout.target(pc, code.l)
+        if not (0 if code.f == OpCode.LOD else 3) <= code.a < layout.size[procedure]:
+            return None
+    return layout
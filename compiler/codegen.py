@@ -0,0 +1,194 @@
+from compiler.pcode import OpCode
+from compiler.syntax import *
+from compiler.exceptions import *
+
+
+class Resolver:
+    """ Resolves the names of a syntax tree with a SymTable, in the order Parser does
+    resolve returns the resolution of the tree, a dict of:
+    - for each Block, the record of its procedure (the main program's for the outermost) and the
+      frame size its INT allocates
+    - for each Assign, Call and Name, its record and the level difference to the frame of the record
+    Errors are raised at the position of the node, as Parser raises them. The tree is not changed.
+    """
+    def __init__(self, table):
+        self.table = table
+        self.level = -1
+        self.resolution = dict()
+
+    def resolve(self, program):
+        from compiler.parser import Record  # parser imports this module
+        self.table.enter(Record())
+        self.block(program.block)
+        return self.resolution
+
+    def enter(self, record, node):
+        try:
+            self.table.enter(record)
+        except CompilerError as e:
+            e.pos = node.pos
+            raise e
+
+    def get(self, node, type_=None):
+        try:
+            record = self.table.get(node.name, type_)
+        except CompilerError as e:
+            e.pos = node.pos
+            raise e
+        self.resolution[node] = (record, self.level - record.level)
+        return record
+
+    def block(self, block):
+        from compiler.parser import Record
+        self.level += 1
+        tx0 = len(self.table) - 1  # the record of the procedure
+        dx = 3
+        for const in block.consts:
+            self.enter(Record('const', const.name, const.value, 0), const)
+        for var in block.vars:
+            self.enter(Record('var', var.name, None, self.level, dx), var)
+            dx += 1
+        for procedure in block.procedures:
+            self.enter(Record('procedure', procedure.name, None, self.level), procedure)
+            self.block(procedure.block)
+        self.resolution[block] = (self.table[tx0], dx)
+        self.statement(block.body)
+        self.level -= 1
+        self.table[tx0+1:] = []
+
+    def statement(self, node):
+        if isinstance(node, Assign):
+            self.get(node, 'var')
+            self.expression(node.expression)
+        elif isinstance(node, If):
+            self.expression(node.condition)
+            self.statement(node.then)
+            self.statement(node.else_)
+        elif isinstance(node, While):
+            self.expression(node.condition)
+            self.statement(node.body)
+        elif isinstance(node, Call):
+            self.get(node, 'procedure')
+        elif isinstance(node, (Begin, Repeat)):
+            for statement in node.statements:
+                self.statement(statement)
+            if isinstance(node, Repeat):
+                self.expression(node.condition)
+        elif isinstance(node, Read):
+            for name in node.names:
+                self.get(name, 'var')
+        elif isinstance(node, Write):
+            for expression in node.expressions:
+                self.expression(expression)
+
+    def expression(self, node):
+        if isinstance(node, Binary):
+            self.expression(node.left)
+            self.expression(node.right)
+        elif isinstance(node, (Negative, Odd)):
+            self.expression(node.operand)
+        elif isinstance(node, Name):
+            if self.get(node).type == 'procedure':
+                raise ParserError('Wrong variable type', node.pos)
+
+
+class CodeGenerator:
+    """ Generates the p-code of a resolved syntax tree into a PCodeManager, the same as Parser does
+    The records of the procedures get their entry address and are appended to procedures.
+    """
+    def __init__(self, pcode, resolution, procedures):
+        self.pcode = pcode
+        self.resolution = resolution
+        self.procedures = procedures
+
+    def gen(self, line, op_code, l, a):
+        self.pcode.line = line
+        self.pcode.gen(op_code, l, a)
+
+    def generate(self, program):
+        self.block(program.block)
+
+    def block(self, block):
+        record, size = self.resolution[block]
+        jmp_line, int_line, return_line = block.lines
+        code1 = len(self.pcode)
+        self.gen(jmp_line, OpCode.JMP, 0, 0)
+        for procedure in block.procedures:
+            self.block(procedure.block)
+        self.pcode[code1].a = len(self.pcode)  # fill back the JMP inst
+        record.address = len(self.pcode)
+        self.procedures.append(record)
+        self.gen(int_line, OpCode.INT, 0, size)
+        self.statement(block.body)
+        self.gen(return_line, OpCode.OPR, 0, 0)
+
+    def statement(self, node):
+        if isinstance(node, Assign):
+            record, level = self.resolution[node]
+            self.expression(node.expression)
+            self.gen(node.line, OpCode.STO, level, record.address)
+
+        elif isinstance(node, If):
+            self.expression(node.condition)
+            code1 = len(self.pcode)
+            self.gen(node.lines[0], OpCode.JPC, 0, 0)
+            self.statement(node.then)
+            code2 = len(self.pcode)
+            self.gen(node.lines[1], OpCode.JMP, 0, 0)
+            self.pcode[code1].a = len(self.pcode)
+            self.statement(node.else_)
+            self.pcode[code2].a = len(self.pcode)
+
+        elif isinstance(node, While):
+            code1 = len(self.pcode)
+            self.expression(node.condition)
+            code2 = len(self.pcode)
+            self.gen(node.lines[0], OpCode.JPC, 0, 0)
+            self.statement(node.body)
+            self.gen(node.lines[1], OpCode.JMP, 0, code1)
+            self.pcode[code2].a = len(self.pcode)
+
+        elif isinstance(node, Call):
+            record, level = self.resolution[node]
+            self.gen(node.line, OpCode.CAL, level, record.address)
+
+        elif isinstance(node, Begin):
+            for statement in node.statements:
+                self.statement(statement)
+
+        elif isinstance(node, Repeat):
+            code1 = len(self.pcode)
+            for statement in node.statements:
+                self.statement(statement)
+            self.expression(node.condition)
+            self.gen(node.line, OpCode.JPC, 0, code1)
+
+        elif isinstance(node, Read):
+            for name in node.names:
+                record, level = self.resolution[name]
+                self.gen(name.line, OpCode.RED, level, record.address)
+
+        elif isinstance(node, Write):
+            for expression, line in zip(node.expressions, node.lines):
+                self.expression(expression)
+                self.gen(line, OpCode.WRT, 0, 0)
+
+    def expression(self, node):
+        if isinstance(node, Binary):
+            self.expression(node.left)
+            self.expression(node.right)
+            self.gen(node.line, OpCode.OPR, 0, node.op)
+        elif isinstance(node, Negative):
+            self.expression(node.operand)
+            self.gen(node.line, OpCode.OPR, 0, 1)
+        elif isinstance(node, Odd):
+            self.expression(node.operand)
+            self.gen(node.line, OpCode.OPR, 0, 6)
+        elif isinstance(node, Number):
+            self.gen(node.line, OpCode.LIT, 0, node.value)
+        else:
+            record, level = self.resolution[node]
+            if record.type == 'const':
+                self.gen(node.line, OpCode.LIT, 0, record.value)
+            else:
+                self.gen(node.line, OpCode.LOD, level, record.address)
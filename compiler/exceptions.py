@@ -38,3 +38,24 @@ class InterpreterError(CompilerError):
     def __init__(self, message='Interpreter error', ln=0):
         self.message = message
         self.ln = ln
+
+
+class LimitExceeded(InterpreterError):
+    """ A program ran into a limit of the interpreter or was cancelled
+    pc is the address of the instruction the program was stopped at, stack_size the size of the stack
+    at that point, steps the number of instructions executed and elapsed the run time in seconds
+    """
+    def __init__(self, message='Limit exceeded', pc=0, stack_size=0, ln=0):
+        self.message = message
+        self.ln = ln
+        self.pc = pc
+        self.stack_size = stack_size
+        self.steps = 0
+        self.elapsed = 0.0
+
+
+class InputRequired(Exception):
+    """ Raised by RED to suspend an interactive program when there is no input left
+    It is handled by the interpreter and never reaches its caller.
+    """
+    pass
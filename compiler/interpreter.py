@@ -1,29 +1,160 @@
 from compiler.parser import PCode, OpCode, Parser
+from compiler.pcode import binary_operations
+from compiler.analysis import resolve_layout
+from compiler.translator import translate, FINISHED, INPUT
 from compiler.exceptions import *
+from array import array
+from collections import deque
+from threading import Event, Thread
+import operator
+import queue
 import sys
+import time
 
 
 class Interpreter:
     """ The interpreter/vm for p-code
+    A run stops with LimitExceeded once it has executed max_steps instructions, its stack holds more
+    than max_stack values, it has run for max_time seconds, or cancel() returns True. None means no
+    limit. Apart from the stack size checked at INT, limits are checked before the instructions at
+    which the steps are a multiple of chunk or reach max_steps, whether a run was resumed or not.
+    If interactive is set, a program reading when there is no input left is suspended instead of
+    failing, and continues with resume once more input is available. The steps limit covers the
+    whole program, the time limit each call.
     """
-    def __init__(self):
-        self.in_ = []
+    chunk = 4096  # instructions run between two checks of the limits
 
-    def interpret(self, pcodes):
+    def __init__(self, max_steps=None, max_stack=None, max_time=None, cancel=None):
+        self.inputs = deque()
+        self.interactive = False
+        self.suspended = None  # state of a program waiting for input
+        self.profiling = False
+        self.counts = None  # executions of each instruction when profiling
+        self.max_steps = max_steps
+        self.max_stack = max_stack
+        self.max_time = max_time
+        self.cancel = cancel
+        self.started = 0.0
+        self.steps = 0  # instructions executed by the last run
+        self.elapsed = 0.0  # duration of the last run in seconds
+        self.error = None  # the InterpreterError that ended the last run, if any
+
+    @property
+    def in_(self):
+        """ Input values that have not been read yet
+        """
+        return self.inputs
+
+    @in_.setter
+    def in_(self, values):
+        self.inputs = deque(values)
+
+    def interpret(self, pcodes, out=None, err=None):
+        """ Run the program, its output is written to out and errors to err
+        (sys.stdout and sys.stderr by default)
+        """
+        self.suspended = None
+        self._run(pcodes, out, err)
+
+    def resume(self, values, out=None, err=None):
+        """ Add values to the input and continue the suspended program
+        """
+        self.inputs.extend(values)
+        self._run(None, out, err)
+
+    def _run(self, pcodes, out, err):
+        self.error = None
+        self.started = time.monotonic()
         try:
-            self._interpret(pcodes)
+            if pcodes is None and self.suspended is None:
+                raise InterpreterError('No program to resume')
+            self._interpret(pcodes, out or sys.stdout)
         except InterpreterError as e:
-            print('%s at %d' % (e.message, e.ln), file=sys.stderr)
+            self.error = e
+            print('%s at %d' % (e.message, e.ln), file=err or sys.stderr)
+        finally:
+            self.elapsed = time.monotonic() - self.started
+            if isinstance(self.error, LimitExceeded):
+                self.error.steps = self.steps
+                self.error.elapsed = self.elapsed
+
+    def stream(self, pcodes, buffer_size=64):
+        """ Run the program in a thread and yield its output as (kind, text) events as it is written
+        kind is 'out' for output and 'err' for the error message. At most buffer_size events are
+        kept, the program waits for them to be consumed before writing more. Closing the generator
+        cancels the program.
+        """
+        events = queue.Queue(buffer_size)
+        closed = Event()
+        cancel = self.cancel
+
+        def run():
+            try:
+                self.interpret(pcodes, out=EventWriter(events, 'out', closed), err=EventWriter(events, 'err', closed))
+            finally:
+                EventWriter(events, None, closed).write(None)
+
+        self.cancel = lambda: closed.is_set() or cancel is not None and cancel()
+        thread = Thread(target=run, daemon=True)
+        thread.start()
+        try:
+            while True:
+                kind, text = events.get()
+                if kind is None:
+                    break
+                try:  # merge the events that are already waiting
+                    while events.queue[0][0] == kind:
+                        text += events.get_nowait()[1]
+                except IndexError:
+                    pass
+                yield kind, text
+        finally:
+            closed.set()
+            thread.join()
+            self.cancel = cancel
+
+    def _first_check(self, steps):
+        """ The steps at which a run starting or resuming after steps instructions first checks the
+        limits: the first multiple of chunk from steps on, or max_steps if it comes before
+        """
+        check_at = -(-steps // self.chunk) * self.chunk
+        if self.max_steps is None:
+            return check_at
+        return min(check_at, self.max_steps)
 
-    def _interpret(self, pcodes):
+    def _check(self, pc, steps, stack):
+        """ Check the limits before running the instruction at pc
+        Returns the number of steps after which they have to be checked again
+        """
+        if self.max_steps is not None and steps >= self.max_steps:
+            raise LimitExceeded('Step limit exceeded', pc, len(stack))
+        if self.max_stack is not None and len(stack) > self.max_stack:
+            raise LimitExceeded('Stack limit exceeded', pc, len(stack))
+        if self.max_time is not None and time.monotonic() - self.started > self.max_time:
+            raise LimitExceeded('Time limit exceeded', pc, len(stack))
+        if self.cancel is not None and self.cancel():
+            raise LimitExceeded('Cancelled', pc, len(stack))
+        if self.max_steps is None:
+            return steps + self.chunk
+        return min(steps + self.chunk, self.max_steps)
+
+    def _interpret(self, pcodes, out):
         def base(l):  # find base l levels down
             t = base_pointer
             for i in range(l):
                 t = stack[t]
             return t
-        program_counter = 0
-        base_pointer = 0
-        stack = [0, 0, 0]
+        if self.suspended:
+            pcodes, program_counter, base_pointer, stack, steps = self.suspended
+            self.suspended = None
+        else:
+            program_counter = 0
+            base_pointer = 0
+            stack = [0, 0, 0]
+            steps = 0
+        check_at = self._first_check(steps)  # steps at which to check the limits
+        i = -1  # index in the current chunk, steps counting the instructions before it
+        max_stack = float('inf') if self.max_stack is None else self.max_stack
         '''
             .last stack.
             base_pointer -> last level pointer (Static Link), used to trace variable location in stack
@@ -38,79 +169,668 @@ class Interpreter:
         '''
         try:
             while True:
+                i = -1
+                if steps == check_at:
+                    check_at = self._check(program_counter, steps, stack)
+                for i in range(check_at - steps):
+                    code = pcodes[program_counter]
+                    program_counter += 1
+                    if code.f == OpCode.LIT:
+                        stack.append(code.a)
+                    elif code.f == OpCode.OPR:
+                        if code.a == 0:  # return
+                            current_base = base_pointer
+                            program_counter = stack[base_pointer+2]  # reset program counter
+                            base_pointer = stack[base_pointer+1]
+                            stack[current_base:] = []
+                        elif code.a == 1:
+                            stack.append(-stack.pop())
+                        elif code.a == 2:
+                            stack.append(stack.pop() + stack.pop())
+                        elif code.a == 3:
+                            stack.append(-stack.pop() + stack.pop())
+                        elif code.a == 4:
+                            stack.append(stack.pop() * stack.pop())
+                        elif code.a == 5:
+                            y = stack.pop()
+                            x = stack.pop()
+                            stack.append(x // y)
+                        elif code.a == 6:
+                            stack.append(stack.pop() % 2)
+                        elif code.a == 7:
+                            stack.append(int(stack.pop() == stack.pop()))
+                        elif code.a == 8:
+                            stack.append(int(stack.pop() != stack.pop()))
+                        elif code.a == 9:
+                            stack.append(int(stack.pop() > stack.pop()))
+                        elif code.a == 10:
+                            stack.append(int(stack.pop() <= stack.pop()))
+                        elif code.a == 11:
+                            stack.append(int(stack.pop() < stack.pop()))
+                        elif code.a == 12:
+                            stack.append(int(stack.pop() >= stack.pop()))
+                    elif code.f == OpCode.LOD:
+                        stack.append(stack[base(code.l)+code.a])
+                    elif code.f == OpCode.STO:
+                        stack[base(code.l)+code.a] = stack.pop()
+                    elif code.f == OpCode.CAL:
+                        stack.append(base(code.l))
+                        stack.append(base_pointer)
+                        stack.append(program_counter)
+                        base_pointer = len(stack) - 3
+                        program_counter = code.a
+                    elif code.f == OpCode.INT:
+                        stack.extend((0,)*(code.a-3))  # because 3 spaces have been allocated in CAL
+                        if len(stack) > max_stack:
+                            raise LimitExceeded('Stack limit exceeded', program_counter-1, len(stack))
+                    elif code.f == OpCode.JMP:
+                        program_counter = code.a
+                    elif code.f == OpCode.JPC:
+                        if stack.pop() == 0:
+                            program_counter = code.a
+                    elif code.f == OpCode.RED:
+                        if self.inputs:
+                            stack[base(code.l) + code.a] = int(self.inputs[0])
+                            self.inputs.popleft()
+                        elif self.interactive:  # wait for input, RED is run again on resume
+                            steps += i
+                            i = -1
+                            self.suspended = (pcodes, program_counter-1, base_pointer, stack, steps)
+                            return
+                        elif __name__ == '__main__':
+                            print('[In] ', end='')
+                            stack[base(code.l)+code.a] = int(input())
+                        else:
+                            raise InterpreterError('Invalid input')
+                    elif code.f == OpCode.WRT:
+                        out.write('[Out] %s\n' % stack[len(stack)-1])
+                    elif code.f == OpCode.LOP:
+                        stack.append(int(binary_operations[code.l](stack.pop(), code.a)))
+                    elif code.f == OpCode.CJP:
+                        y = stack.pop()
+                        if not binary_operations[code.l](stack.pop(), y):
+                            program_counter = code.a
+                    if program_counter == 0:  # main returns
+                        break
+                else:
+                    steps = check_at
+                    continue
+                break
+            print(file=out)
+            print('Program finished!', file=out)
+        except InterpreterError as e:
+            e.ln = program_counter
+            raise e
+        except Exception as e:
+            raise InterpreterError(e, program_counter)  # though pc++ at the beginning, ln = pc+1
+        finally:
+            self.steps = steps + i + 1
+
+
+class EventWriter:
+    """ Writer putting (kind, text) events into a queue, until closed is set
+    """
+    def __init__(self, events, kind, closed):
+        self.events = events
+        self.kind = kind
+        self.closed = closed
+
+    def write(self, text):
+        while not self.closed.is_set():
+            try:
+                self.events.put((self.kind, text), timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def flush(self):
+        pass
+
+
+class ThreadedInterpreter(Interpreter):
+    """ An interpreter that decodes the p-code once before running it
+    Every instruction becomes a closure that executes it and returns the next program counter, with
+    its operands bound in advance, so that running the program is a list lookup and a call per
+    instruction instead of a chain of OpCode comparisons. Output and errors are the same as
+    Interpreter's.
+    If profiling is set, counts[pc] is the number of times the instruction at pc was executed. The
+    counting is done by a loop of its own, so it costs nothing when profiling is off.
+    """
+    def _interpret(self, pcodes, out):
+        ops = []
+        program_counter = 0
+        steps = 0  # instructions executed before the current chunk
+        i = -1  # index in the current chunk
+        self.out = out
+        try:
+            if self.suspended:
+                ops, stack, program_counter, steps = self.suspended
+                self.suspended = None
+            else:
+                ops, stack = self._decode(pcodes)
+                self.counts = [0] * len(ops) if self.profiling else None
+            counts = self.counts
+            check_at = self._first_check(steps)
+            while True:
+                i = -1
+                if steps == check_at:
+                    check_at = self._check(program_counter, steps, stack)
+                if counts is None:
+                    for i in range(check_at - steps):
+                        program_counter = ops[program_counter]()
+                        if program_counter == 0:  # main returns
+                            break
+                    else:
+                        steps = check_at
+                        continue
+                else:  # the same loop, counting the executions of each instruction
+                    for i in range(check_at - steps):
+                        counts[program_counter] += 1
+                        program_counter = ops[program_counter]()
+                        if program_counter == 0:
+                            break
+                    else:
+                        steps = check_at
+                        continue
+                break
+            print(file=out)
+            print('Program finished!', file=out)
+        except InputRequired:  # RED is run again on resume
+            steps += i
+            i = -1
+            self.suspended = (ops, stack, program_counter, steps)
+        except Exception as e:
+            # the failing instruction was fetched unless the program counter is out of range, or it
+            # is a limit that stopped the program before the next instruction
+            ln = program_counter + 1 if i >= 0 and -len(ops) <= program_counter < len(ops) else program_counter
+            if isinstance(e, InterpreterError):
+                e.ln = ln
+                raise e
+            raise InterpreterError(e, ln)
+        finally:
+            self.steps = steps + i + 1
+
+    def _decode(self, pcodes):
+        """ Decode pcodes into handlers sharing one vm state, returns the handlers and the stack
+        If the frame layout can be resolved statically, every frame reached through static links is
+        taken from a display, where display[k] is the base of the innermost frame of lexical level k.
+        CAL saves the entry it replaces and the matching return restores it.
+        """
+        stack = [0, 0, 0]  # same layout as in Interpreter._interpret
+        base_pointer = 0
+        push = stack.append
+        pop = stack.pop
+        layout = resolve_layout(pcodes)
+        display = [0] * (max(layout.entry_level.values()) + 1 if layout else 0)
+        saved = []
+        max_stack = float('inf') if self.max_stack is None else self.max_stack
+
+        def base(l):  # find base l levels down
+            t = base_pointer
+            for i in range(l):
+                t = stack[t]
+            return t
+
+        def level(l, n):  # absolute level of the frame l levels down from instruction n-1, if resolved
+            if layout and layout.level[n-1] is not None:
+                return layout.target(n-1, l)[0]
+
+        def lit(l, a, n):
+            def op():
+                push(a)
+                return n
+            return op
+
+        def lod(l, a, n):
+            k = level(l, n)
+
+            def op():
+                push(stack[base(l)+a])
+                return n
+
+            def local():
+                push(stack[base_pointer+a])
+                return n
+
+            def resolved():
+                push(stack[display[k]+a])
+                return n
+            return local if l == 0 else op if k is None else resolved
+
+        def sto(l, a, n):
+            k = level(l, n)
+
+            def op():
+                stack[base(l)+a] = pop()
+                return n
+
+            def local():
+                stack[base_pointer+a] = pop()
+                return n
+
+            def resolved():
+                stack[display[k]+a] = pop()
+                return n
+            return local if l == 0 else op if k is None else resolved
+
+        def cal(l, a, n):
+            k = level(l, n)
+
+            def op():
+                nonlocal base_pointer
+                push(base(l))
+                push(base_pointer)
+                push(n)
+                base_pointer = len(stack) - 3
+                return a
+
+            def resolved():
+                nonlocal base_pointer
+                push(display[k])
+                push(base_pointer)
+                push(n)
+                base_pointer = len(stack) - 3
+                saved.append(display[k+1])
+                display[k+1] = base_pointer
+                return a
+            return op if k is None else resolved
+
+        def int_(l, a, n):
+            def op():
+                stack.extend((0,)*(a-3))  # because 3 spaces have been allocated in CAL
+                if len(stack) > max_stack:
+                    raise LimitExceeded('Stack limit exceeded', n-1, len(stack))
+                return n
+            return op
+
+        def jmp(l, a, n):
+            def op():
+                return a
+            return op
+
+        def jpc(l, a, n):
+            def op():
+                if pop() == 0:
+                    return a
+                return n
+            return op
+
+        def red(l, a, n):
+            k = level(l, n)
+
+            def op():
+                if self.inputs:
+                    stack[(base(l) if k is None else display[k]) + a] = int(self.inputs[0])
+                    self.inputs.popleft()
+                elif self.interactive:
+                    raise InputRequired()
+                elif __name__ == '__main__':
+                    print('[In] ', end='')
+                    stack[(base(l) if k is None else display[k]) + a] = int(input())
+                else:
+                    raise InterpreterError('Invalid input')
+                return n
+            return op
+
+        def wrt(l, a, n):
+            def op():
+                self.out.write('[Out] %s\n' % stack[len(stack)-1])
+                return n
+            return op
+
+        def lop(l, a, n):
+            operation = binary_operations[l]
+
+            def op():
+                push(int(operation(pop(), a)))
+                return n
+            return op
+
+        def cjp(l, a, n):
+            operation = binary_operations[l]
+
+            def op():
+                y = pop()
+                if operation(pop(), y):
+                    return n
+                return a
+            return op
+
+        def opr(l, a, n):
+            k = level(0, n)
+
+            def ret():
+                nonlocal base_pointer
+                current_base = base_pointer
+                program_counter = stack[base_pointer+2]  # reset program counter
+                base_pointer = stack[base_pointer+1]
+                del stack[current_base:]
+                if k:  # returning from a procedure entered by a resolved CAL
+                    display[k] = saved.pop()
+                return program_counter
+
+            def neg():
+                push(-pop())
+                return n
+
+            def add():
+                push(pop() + pop())
+                return n
+
+            def sub():
+                push(-pop() + pop())
+                return n
+
+            def mul():
+                push(pop() * pop())
+                return n
+
+            def div():
+                y = pop()
+                x = pop()
+                push(x // y)
+                return n
+
+            def odd():
+                push(pop() % 2)
+                return n
+
+            def eq():
+                push(int(pop() == pop()))
+                return n
+
+            def ne():
+                push(int(pop() != pop()))
+                return n
+
+            def gt():
+                push(int(pop() > pop()))
+                return n
+
+            def le():
+                push(int(pop() <= pop()))
+                return n
+
+            def lt():
+                push(int(pop() < pop()))
+                return n
+
+            def ge():
+                push(int(pop() >= pop()))
+                return n
+
+            def nop():
+                return n
+            return {0: ret, 1: neg, 2: add, 3: sub, 4: mul, 5: div, 6: odd,
+                    7: eq, 8: ne, 9: gt, 10: le, 11: lt, 12: ge}.get(a, nop)
+
+        decoders = {
+            OpCode.LIT: lit, OpCode.OPR: opr, OpCode.LOD: lod, OpCode.STO: sto, OpCode.CAL: cal,
+            OpCode.INT: int_, OpCode.JMP: jmp, OpCode.JPC: jpc, OpCode.RED: red, OpCode.WRT: wrt,
+            OpCode.LOP: lop, OpCode.CJP: cjp,
+        }
+        return [decoders[code.f](code.l, code.a, program_counter+1) for program_counter, code in enumerate(pcodes)], stack
+
+
+class CompiledInterpreter(ThreadedInterpreter):
+    """ An interpreter that translates the p-code into a Python function, see compiler.translator
+    The translation is cached by program. Between blocks the vm state is the same as Interpreter's,
+    so the reference interpreter takes over whenever a program jumps to an address that does not
+    start a block, or when Interpreter would find a limit exceeded inside the next block, which keeps
+    output, errors and steps the same as Interpreter's. Programs that cannot be translated, and profiling, are left
+    to ThreadedInterpreter.
+    """
+    def _interpret(self, pcodes, out):
+        suspended = self.suspended
+        if suspended is not None and len(suspended) == 4 or suspended is None and self.profiling:
+            return ThreadedInterpreter._interpret(self, pcodes, out)  # state of ThreadedInterpreter
+        if suspended is not None:
+            pcodes, program_counter, base_pointer, stack, steps = suspended
+            self.suspended = None
+        else:
+            program_counter = 0
+            base_pointer = 0
+            stack = [0, 0, 0]
+            steps = 0
+        translation = translate(pcodes)
+        if translation is None:
+            if suspended is None:
+                return ThreadedInterpreter._interpret(self, pcodes, out)
+            self.suspended = suspended
+            return Interpreter._interpret(self, None, out)
+        max_stack = float('inf') if self.max_stack is None else self.max_stack
+        self.steps = steps
+        try:
+            check_at = self._first_check(steps)
+            while True:
+                if steps == check_at:
+                    check_at = self._check(program_counter, steps, stack)
+                status, program_counter, base_pointer, steps = translation.run(
+                    stack, program_counter, base_pointer, steps, check_at, self.inputs, out.write, max_stack)
+                self.steps = steps
+                if status == FINISHED:
+                    break
+                if status == INPUT:
+                    if self.interactive:  # RED is run again on resume
+                        self.suspended = (pcodes, program_counter, base_pointer, stack, steps)
+                        return
+                    break
+                size = translation.sizes.get(program_counter)
+                if size is None or not self._check_block(pcodes, program_counter, steps, size, stack):
+                    break
+                check_at = self._first_check(steps + size)
+        except Exception as e:
+            location = translation.locate(e)
+            if location is None:  # a limit checked between two blocks
+                ln = program_counter
+            else:
+                i, self.steps = location
+                ln = i + 1
+            if isinstance(e, InterpreterError):
+                e.ln = ln
+                raise e
+            raise InterpreterError(e, ln)
+        if status == INPUT:
+            self.steps += 1
+            raise InterpreterError('Invalid input', program_counter + 1)
+        if status != FINISHED:  # run the rest one instruction at a time
+            self.suspended = (pcodes, program_counter, base_pointer, stack, steps)
+            return Interpreter._interpret(self, None, out)
+        print(file=out)
+        print('Program finished!', file=out)
+
+    def _check_block(self, pcodes, pc, steps, size, stack):
+        """ Check the limits where Interpreter would inside the block of size instructions at pc
+        The stack size at each check follows from the stack effects of the instructions before it.
+        Returns False if a check fails, Interpreter then runs the block and stops at the same place.
+        """
+        check_at = self._first_check(steps)
+        depth = len(stack)
+        i = pc
+        while check_at < steps + size:
+            while i < pc + check_at - steps:
+                depth += stack_effect(pcodes[i])
+                i += 1
+            try:
+                check_at = self._check(i, check_at, range(depth))  # range(depth) has the size of the stack
+            except LimitExceeded:
+                return False
+        return True
+
+
+def stack_effect(code):
+    """ The change of the stack size by an instruction that does not end a block
+    """
+    if code.f in (OpCode.LIT, OpCode.LOD):
+        return 1
+    if code.f == OpCode.OPR:
+        return 0 if code.a in (1, 6) else -1
+    if code.f == OpCode.INT:
+        return code.a - 3
+    if code.f in (OpCode.STO, OpCode.JPC):
+        return -1
+    if code.f == OpCode.CJP:
+        return -2
+    return 0
+
+
+def wrap32(x):
+    """ x as a 32-bit two's complement integer
+    """
+    return ((x + 0x80000000) & 0xffffffff) - 0x80000000
+
+
+def truncating_division(x, y):
+    """ Integer division rounding toward zero, as in C and Pascal
+    """
+    q = abs(x) // abs(y)
+    return q if (x < 0) == (y < 0) else -q
+
+
+class ArrayInterpreter(Interpreter):
+    """ An interpreter whose stack is an array of 64-bit integers of stack_size values, allocated once
+    sp is the index of the first free slot. CAL, INT and returns only move sp and base_pointer, and a
+    program needing more than stack_size values stops with 'Stack limit exceeded'. A value that does
+    not fit in 64 bits is an 'Integer overflow' error.
+    With wrap, integers are 32-bit and wrap around, and division rounds toward zero, like in the
+    classic pl0.exe. Values above sp are not cleared when popped, so p-code reading above the top of
+    the stack reads stale values where Interpreter would fail.
+    """
+    def __init__(self, max_steps=None, max_stack=None, max_time=None, cancel=None, stack_size=1 << 16,
+                 wrap=False):
+        super().__init__(max_steps, max_stack, max_time, cancel)
+        self.stack_size = stack_size
+        self.wrap = wrap
+
+    def _interpret(self, pcodes, out):
+        def base(l):  # find base l levels down
+            t = base_pointer
+            for i in range(l):
+                t = stack[t]
+            return t
+        if self.suspended:
+            pcodes, program_counter, base_pointer, stack, sp, steps = self.suspended
+            self.suspended = None
+        else:
+            program_counter = 0
+            base_pointer = 0
+            stack = array('q', bytes(8 * max(self.stack_size, 3)))  # the 3 links of the main program
+            sp = 3
+            steps = 0
+        size = len(stack)
+        check_at = self._first_check(steps)
+        max_stack = size if self.max_stack is None else min(self.max_stack, size)
+        wrap = self.wrap
+        operations = dict(binary_operations)
+        negate = operator.neg
+        if wrap:
+            for a in (2, 3, 4):
+                operations[a] = (lambda operation: lambda x, y: wrap32(operation(x, y)))(operations[a])
+            operations[5] = lambda x, y: wrap32(truncating_division(x, y))
+            negate = lambda x: wrap32(-x)
+        # zeros to clear the variables of each frame size with
+        zeros = {code.a: memoryview(array('q', bytes(8 * (code.a-3))))
+                 for code in pcodes if code.f == OpCode.INT and isinstance(code.a, int) and code.a > 3}
+        view = memoryview(stack)
+        LIT, OPR, LOD, STO, CAL, INT = OpCode.LIT, OpCode.OPR, OpCode.LOD, OpCode.STO, OpCode.CAL, OpCode.INT
+        JMP, JPC, RED, WRT, LOP, CJP = OpCode.JMP, OpCode.JPC, OpCode.RED, OpCode.WRT, OpCode.LOP, OpCode.CJP
+        try:
+            while True:
+                if steps == check_at:
+                    check_at = self._check(program_counter, steps, range(sp))  # range(sp) has the size of the stack
                 code = pcodes[program_counter]
                 program_counter += 1
-                if code.f == OpCode.LIT:
-                    stack.append(code.a)
-                elif code.f == OpCode.OPR:
-                    if code.a == 0:  # return
-                        current_base = base_pointer
-                        program_counter = stack[base_pointer+2]  # reset program counter
-                        base_pointer = stack[base_pointer+1]
-                        stack[current_base:] = []
-                    elif code.a == 1:
-                        stack.append(-stack.pop())
-                    elif code.a == 2:
-                        stack.append(stack.pop() + stack.pop())
-                    elif code.a == 3:
-                        stack.append(-stack.pop() + stack.pop())
-                    elif code.a == 4:
-                        stack.append(stack.pop() * stack.pop())
-                    elif code.a == 5:
-                        y = stack.pop()
-                        x = stack.pop()
-                        stack.append(x // y)
-                    elif code.a == 6:
-                        stack.append(stack.pop() % 2)
-                    elif code.a == 7:
-                        stack.append(int(stack.pop() == stack.pop()))
-                    elif code.a == 8:
-                        stack.append(int(stack.pop() != stack.pop()))
-                    elif code.a == 9:
-                        stack.append(int(stack.pop() > stack.pop()))
-                    elif code.a == 10:
-                        stack.append(int(stack.pop() <= stack.pop()))
-                    elif code.a == 11:
-                        stack.append(int(stack.pop() < stack.pop()))
-                    elif code.a == 12:
-                        stack.append(int(stack.pop() >= stack.pop()))
-                elif code.f == OpCode.LOD:
-                    stack.append(stack[base(code.l)+code.a])
-                elif code.f == OpCode.STO:
-                    stack[base(code.l)+code.a] = stack.pop()
-                elif code.f == OpCode.CAL:
-                    stack.append(base(code.l))
-                    stack.append(base_pointer)
-                    stack.append(program_counter)
-                    base_pointer = len(stack) - 3
-                    program_counter = code.a
-                elif code.f == OpCode.INT:
-                    stack.extend((0,)*(code.a-3))  # because 3 spaces have been allocated in CAL
-                elif code.f == OpCode.JMP:
+                steps += 1
+                f = code.f
+                if f is LIT:
+                    stack[sp] = wrap32(code.a) if wrap else code.a
+                    sp += 1
+                elif f is LOD:
+                    stack[sp] = stack[base(code.l)+code.a]
+                    sp += 1
+                elif f is STO:
+                    sp -= 1
+                    stack[base(code.l)+code.a] = stack[sp]
+                elif f is OPR:
+                    a = code.a
+                    if a == 0:  # return
+                        sp = base_pointer
+                        program_counter = stack[sp+2]
+                        base_pointer = stack[sp+1]
+                    elif a == 1:
+                        stack[sp-1] = negate(stack[sp-1])
+                    elif a == 6:
+                        stack[sp-1] %= 2
+                    elif a in operations:
+                        sp -= 1
+                        stack[sp-1] = operations[a](stack[sp-1], stack[sp])
+                elif f is LOP:
+                    stack[sp-1] = operations[code.l](stack[sp-1], code.a)
+                elif f is CJP:
+                    sp -= 2
+                    if not operations[code.l](stack[sp], stack[sp+1]):
+                        program_counter = code.a
+                elif f is JMP:
                     program_counter = code.a
-                elif code.f == OpCode.JPC:
-                    if stack.pop() == 0:
+                elif f is JPC:
+                    sp -= 1
+                    if stack[sp] == 0:
                         program_counter = code.a
-                elif code.f == OpCode.RED:
-                    if len(self.in_):
-                        stack[base(code.l) + code.a] = int(self.in_[0])
-                        self.in_ = self.in_[1:]
-                    elif __name__ == '__main__':
-                        print('[In] ', end='')
-                        stack[base(code.l)+code.a] = int(input())
+                elif f is CAL:
+                    if sp + 3 > size:
+                        raise LimitExceeded('Stack limit exceeded', program_counter-1, sp)
+                    stack[sp] = base(code.l)
+                    stack[sp+1] = base_pointer
+                    stack[sp+2] = program_counter
+                    base_pointer = sp
+                    sp += 3
+                    program_counter = code.a
+                elif f is INT:
+                    top = sp + code.a - 3  # because 3 spaces have been allocated in CAL
+                    if top > max_stack:
+                        raise LimitExceeded('Stack limit exceeded', program_counter-1, top)
+                    if top > sp:
+                        view[sp:top] = zeros[code.a]
+                        sp = top
+                elif f is RED:
+                    if self.inputs:
+                        value = int(self.inputs[0])
+                        stack[base(code.l) + code.a] = wrap32(value) if wrap else value
+                        self.inputs.popleft()
+                    elif self.interactive:  # wait for input, RED is run again on resume
+                        steps -= 1
+                        self.suspended = (pcodes, program_counter-1, base_pointer, stack, sp, steps)
+                        return
                     else:
                         raise InterpreterError('Invalid input')
-                elif code.f == OpCode.WRT:
-                    print('[Out]', stack[len(stack)-1])
+                elif f is WRT:
+                    out.write('[Out] %s\n' % stack[sp-1])
                 if program_counter == 0:  # main returns
                     break
-            print()
-            print('Program finished!')
+            print(file=out)
+            print('Program finished!', file=out)
         except InterpreterError as e:
             e.ln = program_counter
             raise e
+        except OverflowError:
+            raise InterpreterError('Integer overflow', program_counter)
+        except IndexError as e:
+            if sp >= size:  # pushing on a full stack
+                raise LimitExceeded('Stack limit exceeded', program_counter-1, sp, program_counter)
+            raise InterpreterError(e, program_counter)
         except Exception as e:
-            raise InterpreterError(e, program_counter)  # though pc++ at the beginning, ln = pc+1
+            raise InterpreterError(e, program_counter)
+        finally:
+            self.steps = steps
+
+
+# engines that can run p-code, by name
+engines = {
+    'reference': Interpreter,
+    'threaded': ThreadedInterpreter,
+    'compiled': CompiledInterpreter,
+    'array': ArrayInterpreter,
+}
 
 
 def main():
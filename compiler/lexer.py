@@ -20,6 +20,15 @@ lexicon = [
 
 lexicon = [(x[0], re.compile(x[1])) for x in lexicon]
 
+# All patterns merged into one, so each token takes a single in-place match instead of trying
+# every pattern on a copy of the remaining source. Alternatives are ordered as in lexicon and no
+# two of them can start with the same character, except KEYWORD and IDENTIFIER: KEYWORD only
+# matches whole words, so a longer identifier such as `dot` still wins over `do` (maximal munch).
+master_pattern = re.compile('|'.join('(?P<%s>%s)' % (name, {
+    'BLANK': r'\s+',
+    'KEYWORD': r'(?:%s)(?![A-Za-z0-9])' % pattern.pattern,
+}.get(name, pattern.pattern)) for name, pattern in lexicon))
+
 
 class Lexer:
     def __init__(self):
@@ -31,25 +40,22 @@ class Lexer:
         self.program = program
 
     def get_symbol(self):
+        program = self.program
+        match = master_pattern.match
         last_line_count = 0  # char count when finishing the last line
-        while self.cur < len(self.program):
-            token = None
-            for record in lexicon:
-                r = record[1].match(self.program[self.cur:])
-                if r and (token is None or r.end() > len(token.value)):
-                    token = Token(record[0], r.group())
-            if token is None:
+        while self.cur < len(program):
+            r = match(program, self.cur)
+            if r is None:
                 raise LexerError('Unidentified character', self.pos)
-            self.cur += len(token.value)
+            self.cur = r.end()
+            if r.lastgroup == 'BLANK':
+                lines = r.group().count('\n')
+                if lines:
+                    self.pos[0] += lines
+                    last_line_count = program.rindex('\n', 0, self.cur) + 1
             self.pos[1] = self.cur - last_line_count
-            if token.type == 'BLANK':
-                if token.value is '\n':
-                    last_line_count = self.cur
-                    self.pos[0] += 1
-                continue
-            else:
-                yield token
-                # print(token[0], token[1])
+            if r.lastgroup != 'BLANK':
+                yield Token(r.lastgroup, r.group())
 
     def get_line(self, ln):
         return self.program.split('\n')[ln-1].strip()
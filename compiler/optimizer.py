@@ -0,0 +1,282 @@
+from compiler.pcode import OpCode, PCode, binary_operations, unary_operations
+from compiler.analysis import resolve_layout
+
+BRANCHES = (OpCode.JMP, OpCode.JPC, OpCode.CJP, OpCode.CAL)
+COMPARISONS = (7, 8, 9, 10, 11, 12)
+MAX_INLINE = 24  # longest body of the procedures inlined, in instructions
+
+
+class Optimizer:
+    """ Peephole optimizer for p-code
+    level 0 leaves the code as it is
+    level 1 folds constant expressions, threads jumps, and removes dead code and jumps to the next
+            instruction
+    level 2 also fuses LIT n; OPR op into (LOP, op, n) and OPR op; JPC 0 a into (CJP, op, a)
+    level 3 also inlines the calls to small procedures that call no other procedure, before anything
+            else. Their variables get slots at the end of the frame of the caller.
+    While optimizing, the target of every branch is kept as the PCode it jumps to, so instructions
+    can be removed freely and addresses are only recomputed at the end. The first instruction is
+    never removed, as jumping to 0 is how the program ends.
+    """
+    def __init__(self, level=1):
+        self.level = level
+        self.before = 0
+        self.after = 0
+        self.target = dict()
+        self.origin = dict()  # index in the original code of each instruction
+        self.changed = False
+        self.inlined = 0  # number of calls inlined
+
+    def optimize(self, pcodes):
+        code = [PCode(c.f, c.l, c.a) for c in pcodes]
+        self.before = len(code)
+        self.target = dict()
+        self.origin = {c: i for i, c in enumerate(code)}
+        self.inlined = 0
+        if self.level > 2:
+            code = self._inline(code)
+        if self.level > 0 and self._link(code):
+            self.changed = True
+            while self.changed:
+                self.changed = False
+                code = self._remove_dead(self._thread(self._fold(code)))
+            if self.level > 1:
+                code = self._fuse(code)
+            index = {c: i for i, c in enumerate(code)}
+            for c in code:
+                if c.f in BRANCHES:
+                    c.a = index[self.target[c]]
+        self.after = len(code)
+        return code
+
+    def report(self):
+        report = '%d -> %d instructions (%.1f%% %s)' % (
+            self.before, self.after, 100 * abs(self.before-self.after) / max(self.before, 1),
+            'more' if self.after > self.before else 'fewer')
+        if self.level > 2:
+            report += ', %d calls inlined' % self.inlined
+        return report
+
+    def _inline(self, code):
+        """ Replace the calls to the procedures _inlinable finds by a copy of their body
+        The variables of a procedure are moved to slots after those of the caller, whose INT grows to
+        hold them, and its accesses to outer frames get the level difference they have from the caller.
+        Variables that can be read before they are written are set to 0 first, as INT would do.
+        """
+        if not all(isinstance(c.a, int) for c in code if c.f in BRANCHES):
+            return code  # _link gives up on these as well
+        layout = resolve_layout(code)
+        if layout is None:
+            return code
+        bodies = self._inlinable(code, layout)
+        sites = [i for i, c in enumerate(code)
+                 if c.f == OpCode.CAL and c.a in bodies and layout.level[i] is not None]
+        if not sites:
+            return code
+        frames = dict()  # INT of each procedure
+        for i, c in enumerate(code):
+            if c.f == OpCode.INT and layout.level[i] is not None:
+                frames[layout.owner[i]] = c
+        extra = dict()  # slots added to the frame of each caller
+        inlined = []
+        address = []  # new address of each instruction of code
+        branches = []  # the instructions of code that are kept, with a target to relocate
+        sites = set(sites)
+        for i, c in enumerate(code):
+            address.append(len(inlined))
+            if i not in sites:
+                inlined.append(c)
+                if c.f in BRANCHES:
+                    branches.append(c)
+                continue
+            entry = c.a
+            end, unset = bodies[entry]
+            caller = layout.owner[i]
+            size = layout.size[caller]
+            extra[caller] = max(extra.get(caller, 0), layout.size[entry] - 3)
+            depth = layout.level[i] - layout.entry_level[entry]  # level difference of the callee frame
+            for a in unset:
+                for copy in (PCode(OpCode.LIT, 0, 0), PCode(OpCode.STO, 0, size + a - 3)):
+                    self.origin[copy] = self.origin[c]
+                    inlined.append(copy)
+            start = len(inlined) - entry - 1  # new address of code[k] is start + k
+            for k in range(entry+1, end):
+                body = code[k]
+                copy = PCode(body.f, body.l, body.a)
+                if body.f in (OpCode.LOD, OpCode.STO, OpCode.RED):
+                    if body.l == 0:
+                        copy.a = size + body.a - 3
+                    else:
+                        copy.l = depth + body.l
+                elif body.f in BRANCHES:
+                    copy.a = start + body.a
+                self.origin[copy] = self.origin[body]
+                inlined.append(copy)
+            self.inlined += 1
+        for c in branches:
+            c.a = address[c.a]
+        for caller, slots in extra.items():
+            frames[caller].a = layout.size[caller] + slots
+        return inlined
+
+    def _inlinable(self, code, layout):
+        """ Procedures that can be inlined, by entry address: those making no call, with a body of at
+        most MAX_INLINE instructions between their INT and their only return, which only jumps inside
+        it and only accesses the variables of its own frame. Gives the index of the return and the
+        variables to clear of each.
+        """
+        owned = dict()  # the instructions of each procedure
+        for i, owner in enumerate(layout.owner):
+            if owner is not None:
+                owned.setdefault(owner, []).append(i)
+        bodies = dict()
+        for entry, instructions in owned.items():
+            end = instructions[-1]
+            if entry == 0 or code[entry].f != OpCode.INT or end - entry - 1 > MAX_INLINE or \
+                    instructions != list(range(entry, end+1)) or code[end].f != OpCode.OPR or code[end].a != 0:
+                continue
+            inlinable = True
+            for c in code[entry+1:end]:
+                if c.f in (OpCode.CAL, OpCode.INT) or c.f == OpCode.OPR and c.a == 0 or \
+                        c.f in BRANCHES and not entry < c.a <= end or \
+                        c.f in (OpCode.LOD, OpCode.STO, OpCode.RED) and c.l == 0 and c.a < 3:
+                    inlinable = False
+                    break
+            if inlinable:
+                bodies[entry] = (end, self._unset(code, entry+1, end))
+        return bodies
+
+    def _unset(self, code, start, end):
+        """ Variables of the frame that code[start:end] may read before writing them
+        """
+        written = {start: frozenset()}  # variables written on every path to each instruction
+        todo = [start]
+        while todo:
+            i = todo.pop()
+            c = code[i]
+            after = written[i]
+            if c.f in (OpCode.STO, OpCode.RED) and c.l == 0:
+                after = after | {c.a}
+            successors = [] if c.f == OpCode.JMP else [i+1]
+            if c.f in (OpCode.JMP, OpCode.JPC, OpCode.CJP):
+                successors.append(c.a)
+            for j in successors:
+                if j >= end:
+                    continue
+                before = written[j] & after if j in written else after
+                if written.get(j) != before:
+                    written[j] = before
+                    todo.append(j)
+        return sorted(set(c.a for i, c in enumerate(code[start:end], start)
+                          if c.f == OpCode.LOD and c.l == 0 and i in written and c.a not in written[i]))
+
+    def _link(self, code):
+        """ Point every branch at the instruction it jumps to, give up on jumps out of the program
+        and on branches without an address, such as a call of an enclosing procedure
+        """
+        for c in code:
+            if c.f in BRANCHES:
+                if not isinstance(c.a, int) or not 0 <= c.a < len(code):
+                    return False
+                self.target[c] = code[c.a]
+        return True
+
+    def _leaders(self, code):
+        """ Instructions that can be reached other than from the one before them
+        """
+        leaders = set(self.target[c] for c in code if c.f in BRANCHES)
+        leaders.update(code[i+1] for i in range(len(code)-1) if code[i].f == OpCode.CAL)  # return address
+        return leaders
+
+    def _fold(self, code):
+        leaders = self._leaders(code)
+        folded = []
+        for c in code:
+            folded.append(c)
+            while len(folded) >= 2 and folded[-2].f == OpCode.LIT and folded[-1] not in leaders:
+                x, op = folded[-2], folded[-1]
+                if op.f == OpCode.OPR and op.a in unary_operations:
+                    value = unary_operations[op.a](x.a)
+                elif len(folded) >= 3 and folded[-3].f == OpCode.LIT and x not in leaders and \
+                        op.f == OpCode.OPR and op.a in binary_operations and not (op.a == 5 and x.a == 0):
+                    x, value = folded[-3], binary_operations[op.a](folded[-3].a, x.a)
+                    folded.pop()
+                else:
+                    break
+                folded.pop()
+                x.a = int(value)  # x keeps its place, so branches to it still land on the result
+                self.changed = True
+        return folded
+
+    def _thread(self, code):
+        """ Make branches skip over JMPs, and turn a JMP to a return into the return itself
+        """
+        for c in code:
+            if c.f not in BRANCHES:
+                continue
+            target, seen = self.target[c], set()
+            while target.f == OpCode.JMP and target is not code[0] and target not in seen:
+                seen.add(target)
+                target = self.target[target]
+            if target is not self.target[c]:
+                self.target[c] = target
+                self.changed = True
+            if c.f == OpCode.JMP and target.f == OpCode.OPR and target.a == 0 and target is not code[0]:
+                c.f, c.l, c.a = OpCode.OPR, target.l, target.a
+                del self.target[c]
+                self.changed = True
+        return code
+
+    def _remove_dead(self, code):
+        """ Drop unreachable instructions and JMPs to the next instruction
+        """
+        index = {c: i for i, c in enumerate(code)}
+        reachable = set()
+        todo = [0]
+        while todo:
+            i = todo.pop()
+            while i < len(code) and code[i] not in reachable:
+                c = code[i]
+                reachable.add(c)
+                if c.f in BRANCHES and self.target[c] is not code[0]:
+                    todo.append(index[self.target[c]])
+                if c.f == OpCode.JMP or c.f == OpCode.OPR and c.a == 0:
+                    break
+                i += 1
+        alive = []
+        replaced = dict()  # removed JMP -> the instruction that now takes its place
+        for c in reversed([c for c in code if c in reachable]):
+            if c.f == OpCode.JMP and alive and c is not code[0]:
+                target = self.target[c]
+                while target in replaced:
+                    target = replaced[target]
+                if target is alive[-1]:
+                    replaced[c] = target
+                    continue
+            alive.append(c)
+        alive.reverse()
+        for c in alive:
+            if c.f in BRANCHES:
+                while self.target[c] in replaced:
+                    self.target[c] = replaced[self.target[c]]
+        if len(alive) < len(code):
+            self.changed = True
+        return alive
+
+    def _fuse(self, code):
+        leaders = self._leaders(code)
+        fused = []
+        for c in code:
+            last = fused[-1] if fused else None
+            if c in leaders or last is None:
+                pass
+            elif c.f == OpCode.JPC and last.f == OpCode.OPR and last.a in COMPARISONS:
+                last.f, last.l, last.a = OpCode.CJP, last.a, 0
+                self.target[last] = self.target[c]
+                continue
+            elif c.f == OpCode.OPR and c.a in binary_operations and c.a not in COMPARISONS and \
+                    last.f == OpCode.LIT:
+                last.f, last.l = OpCode.LOP, c.a
+                continue
+            fused.append(c)
+        return fused
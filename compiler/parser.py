@@ -1,36 +1,13 @@
 from compiler.lexer import Lexer, Token
+from compiler.pcode import OpCode, PCode
+from compiler.optimizer import Optimizer
+from compiler.syntax import TreeParser
+from compiler.codegen import Resolver, CodeGenerator
 from compiler.exceptions import *
-from enum import Enum
-from copy import deepcopy
+from copy import copy
 import sys
 
 
-class OpCode(Enum):
-    LIT = 1
-    OPR = 2
-    LOD = 3
-    STO = 4
-    CAL = 5
-    INT = 6
-    JMP = 7
-    JPC = 8
-    RED = 9
-    WRT = 10
-
-    def __str__(self):
-        return self.name
-
-
-class PCode:
-    def __init__(self, f=None, l=None, a=None):
-        self.f = f
-        self.l = l
-        self.a = a
-
-    def __str__(self):
-        return '({}, {}, {})'.format(self.f, self.l, self.a)
-
-
 class Record:
     """ Record is the element in SymTable
     type is var, const or procedure
@@ -54,40 +31,80 @@ class Record:
 
 class SymTable:
     """ A table to store Records. By properly using get and enter, duplications are avoided
+    Records are kept in declaration order in self.table, and indexed by name in self.names, which
+    maps a name to the positions of its visible records, innermost last. self.scopes is a stack of
+    the positions where each run of records with the same level begins, i.e. the range searched
+    for duplications.
     """
     def __init__(self):
         self.table = []
+        self.names = {}
+        self.scopes = []
 
     def __getitem__(self, item):
         return self.table[item]
 
     def __setitem__(self, key, value):
+        if isinstance(key, slice) and not value:
+            start, stop, step = key.indices(len(self.table))
+            if stop == len(self.table) and step == 1:  # leaving a block, e.g. table[tx0+1:] = []
+                self.truncate(start)
+                return
         self.table[key] = value
+        self._reindex()
 
     def __len__(self):
         return len(self.table)
 
     def get(self, name, type_=None):
-        for record in self.table[::-1]:
-            if record.name == name:
-                if type_ and record.type != type_:
-                    raise WrongSymbolType('Unexpected symbol type, expecting %s' % type_)
-                else:
-                    return record
-        raise UndefinedSymbol('Undefined symbol: %s' % name)
+        positions = self.names.get(name)
+        if not positions:
+            raise UndefinedSymbol('Undefined symbol: %s' % name)
+        record = self.table[positions[-1]]
+        if type_ and record.type != type_:
+            raise WrongSymbolType('Unexpected symbol type, expecting %s' % type_)
+        return record
 
     def enter(self, record):
-        for existing_record in self.table[::-1]:
-            if record.level != existing_record.level:
-                break
-            if record.name == existing_record.name and record.type == existing_record.type:
-                raise DuplicateSymbol('Duplicate symbol name: %s' % record.name)
-        self.table.append(deepcopy(record))
+        if self.table and self.table[-1].level == record.level:
+            scope = self.scopes[-1]
+            for i in reversed(self.names.get(record.name, ())):
+                if i < scope:
+                    break
+                if self.table[i].type == record.type:
+                    raise DuplicateSymbol('Duplicate symbol name: %s' % record.name)
+        else:
+            self.scopes.append(len(self.table))
+        self.names.setdefault(record.name, []).append(len(self.table))
+        self.table.append(copy(record))
+
+    def truncate(self, size):
+        """ Drop every record from position size on, in O(number of dropped records)
+        """
+        for record in self.table[size:]:
+            positions = self.names[record.name]
+            positions.pop()
+            if not positions:
+                del self.names[record.name]
+        while self.scopes and self.scopes[-1] >= size:
+            self.scopes.pop()
+        del self.table[size:]
+
+    def _reindex(self):
+        table = self.table
+        self.table, self.names, self.scopes = [], {}, []
+        for record in table:
+            if not (self.table and self.table[-1].level == record.level):
+                self.scopes.append(len(self.table))
+            self.names.setdefault(record.name, []).append(len(self.table))
+            self.table.append(record)
 
 
 class PCodeManager:
     def __init__(self):
         self.code = []
+        self.lines = []  # source line of each pcode
+        self.line = 1  # source line of the pcodes being generated
 
     def __getitem__(self, item):
         return self.code[item]
@@ -103,36 +120,83 @@ class PCodeManager:
 
     def gen(self, op_code, l, a):
         self.code.append(PCode(op_code, l, a))
+        self.lines.append(self.line)
+
+    def relocate(self, code, origin):
+        """ Replace the pcodes by code, origin giving the index of the pcode each one comes from
+        Returns the new index of every old index that is kept
+        """
+        self.lines = [self.lines[origin[c]] for c in code]
+        self.code = code
+        return {origin[c]: i for i, c in enumerate(code)}
 
 
 class Parser:
     """ Parser for PL/0 grammar
     You need to create an instance of parser for each program
+    opt_level is passed to Optimizer, the p-code is optimized before it is printed and returned
+    With syntax_tree, the program is first parsed into a syntax tree (kept in self.tree), whose names
+    are then resolved and p-code generated in passes of their own. The p-code is the same, but syntax
+    errors are reported before errors about symbols.
     """
-    def __init__(self):
+    def __init__(self, opt_level=0, syntax_tree=False):
         self.lexer = Lexer()
         self.token_generator = None
         self.current_token = None
         self.current_level = -1
         self.table = SymTable()
         self.pcode = PCodeManager()
+        self.procedures = []  # records of the main program and all procedures, with their entry address
+        self.optimizer = Optimizer(opt_level)
+        self.syntax_tree = syntax_tree
+        self.tree = None
 
     def load_program(self, program):
         self.lexer.load_program(program)
         self.token_generator = self.lexer.get_symbol()
 
-    def analyze(self):
+    def load_tree(self, tree, program):
+        """ Compile tree, the syntax tree of program built by another Parser, instead of parsing program
+        again. program is only used to print errors.
+        """
+        self.lexer.load_program(program)
+        self.tree = tree
+
+    def analyze(self, out=None, err=None):
+        """ Compile the program, the p-code listing is written to out and errors to err
+        (sys.stdout and sys.stderr by default)
+        """
+        out = out or sys.stdout
+        err = err or sys.stderr
         try:
-            self._program()
+            if self.syntax_tree or self.tree is not None:
+                self._compile_tree()
+            else:
+                self._program()
             # print('Compile Successful!')
+            if self.optimizer.level:
+                moved = self.pcode.relocate(self.optimizer.optimize(self.pcode.get()), self.optimizer.origin)
+                # procedures that are never called, or whose calls were all inlined, are gone
+                self.procedures = [procedure for procedure in self.procedures if procedure.address in moved]
+                for procedure in self.procedures:
+                    procedure.address = moved[procedure.address]
             for ln, line in enumerate(self.pcode):
                 # print('[%d]' % ln, line)
-                print(line)
+                print(line, file=out)
+            if self.optimizer.level:
+                print('#', self.optimizer.report(), file=out)
             return self.pcode.get()
         except CompilerError as e:
-            e.pos = self.lexer.pos
-            print('[%d] %s' % (e.pos[0], self.lexer.get_line(e.pos[0])), file=sys.stderr)
-            print('*** %s at %s' % (e.message, str(e.pos)), file=sys.stderr)
+            if not (self.syntax_tree or self.tree is not None):
+                e.pos = self.lexer.pos
+            print('[%d] %s' % (e.pos[0], self.lexer.get_line(e.pos[0])), file=err)
+            print('*** %s at %s' % (e.message, str(e.pos)), file=err)
+
+    def _compile_tree(self):
+        if self.tree is None:
+            self.tree = TreeParser(self.lexer, self.token_generator).parse()
+        resolution = Resolver(self.table).resolve(self.tree)
+        CodeGenerator(self.pcode, resolution, self.procedures).generate(self.tree)
 
     def _program(self):
         """ The following is rec-descent parser.
@@ -219,6 +283,7 @@ class Parser:
             _procedure()
         self.pcode[code1].a = len(self.pcode)  # fill back the JMP inst
         self.table[tx0].address = len(self.pcode)  # this value will be used by call
+        self.procedures.append(self.table[tx0])
         self.pcode.gen(OpCode.INT, 0, dx)
         self._statement()
         self.pcode.gen(OpCode.OPR, 0, 0)
@@ -396,6 +461,7 @@ class Parser:
             self._forward()
 
     def _forward(self):
+        self.pcode.line = self.lexer.pos[0]  # code is attributed to the line of the last token consumed
         try:
             self.current_token = next(self.token_generator)
         except StopIteration:
@@ -0,0 +1,160 @@
+from array import array
+from enum import Enum
+import mmap
+import operator
+import struct
+import sys
+
+
+class OpCode(Enum):
+    LIT = 1
+    OPR = 2
+    LOD = 3
+    STO = 4
+    CAL = 5
+    INT = 6
+    JMP = 7
+    JPC = 8
+    RED = 9
+    WRT = 10
+    # superinstructions, only emitted by the optimizer
+    LOP = 11  # (LOP, op, n): OPR op with the literal n as right operand, i.e. LIT n; OPR op
+    CJP = 12  # (CJP, op, a): jump to a unless comparison op holds, i.e. OPR op; JPC 0 a
+
+    def __str__(self):
+        return self.name
+
+
+class PCode:
+    __slots__ = ('f', 'l', 'a')
+
+    def __init__(self, f=None, l=None, a=None):
+        self.f = f
+        self.l = l
+        self.a = a
+
+    def __str__(self):
+        return '({}, {}, {})'.format(self.f, self.l, self.a)
+
+
+# OPR a on the two topmost values x and y, y being on top. Comparisons give bool, which must be
+# turned into int before going back to the stack
+binary_operations = {
+    2: operator.add,
+    3: operator.sub,
+    4: operator.mul,
+    5: operator.floordiv,
+    7: operator.eq,
+    8: operator.ne,
+    9: operator.lt,
+    10: operator.ge,
+    11: operator.gt,
+    12: operator.le,
+}
+
+# OPR a on the topmost value
+unary_operations = {
+    1: operator.neg,
+    6: lambda x: x % 2,
+}
+
+
+# Binary p-code files: a header of magic, format version, flags (unused, 0) and instruction count,
+# followed by an (f, l, a) triple of little-endian 64-bit ints for each instruction, f being the
+# value of the OpCode. Version 1 used 32-bit ints.
+MAGIC = b'PL0C'
+VERSION = 2
+header = struct.Struct('<4sHHI')
+
+
+class PackedCode:
+    """ A read-only sequence of PCode stored as packed (f, l, a) triples
+    words is any sequence of ints, e.g. an array('q') or a memoryview over a binary file, so a
+    program takes 24 bytes per instruction. Indexing creates the PCode on the fly.
+    """
+    def __init__(self, words):
+        self.words = words
+
+    def __len__(self):
+        return len(self.words) // 3
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self[i] for i in range(*item.indices(len(self)))]
+        if item < 0:
+            item += len(self)
+        if not 0 <= item < len(self):
+            raise IndexError('p-code index out of range')
+        f, l, a = self.words[3*item:3*item+3]
+        return PCode(OpCode(f), l, a)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+def pack(pcodes):
+    """ Pack pcodes into a PackedCode backed by an array('q')
+    Raises ValueError if an operand does not fit in 64 bits.
+    """
+    words = array('q')
+    for code in pcodes:
+        try:
+            words.extend((code.f.value, code.l, code.a))
+        except OverflowError:
+            raise ValueError('Operand out of the range of the p-code format: %s' % code)
+    return PackedCode(words)
+
+
+def dumps(pcodes):
+    """ Serialize pcodes into the binary format, raises ValueError if they do not fit in it
+    """
+    words = pack(pcodes).words
+    if sys.byteorder != 'little':
+        words.byteswap()
+    return header.pack(MAGIC, VERSION, 0, len(words) // 3) + words.tobytes()
+
+
+def dump(pcodes, f):
+    f.write(dumps(pcodes))
+
+
+def _words(buffer):
+    """ The instruction words of a binary p-code file, checking the header and the opcodes
+    """
+    if len(buffer) < header.size:
+        raise ValueError('Not a p-code file')
+    magic, version, flags, count = header.unpack_from(buffer)
+    if magic != MAGIC:
+        raise ValueError('Not a p-code file')
+    if version != VERSION:
+        raise ValueError('Unsupported p-code version %d' % version)
+    if len(buffer) != header.size + 24*count:
+        raise ValueError('Truncated p-code file')
+    if sys.byteorder == 'little':
+        words = memoryview(buffer)[header.size:].cast('q')
+    else:
+        words = array('q', memoryview(buffer)[header.size:])
+        words.byteswap()
+    if not set(words[0::3]) <= set(code.value for code in OpCode):
+        raise ValueError('Unknown opcode in p-code file')
+    return words
+
+
+def loads(data):
+    """ Deserialize a binary p-code program into a list of PCode
+    """
+    return list(PackedCode(_words(data)))
+
+
+def load(f):
+    return loads(f.read())
+
+
+def map_file(path):
+    """ Memory-map a binary p-code file, the instructions are read from the file as they are used
+    """
+    with open(path, 'rb') as f:
+        if len(f.read(1)) == 0:
+            raise ValueError('Not a p-code file')
+        return PackedCode(_words(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)))
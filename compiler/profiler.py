@@ -0,0 +1,74 @@
+from compiler.pcode import OpCode
+from compiler.interpreter import ThreadedInterpreter
+
+# names of the OPR sub-operations, also used for the operation of LOP and CJP
+operation_names = {
+    0: 'ret', 1: 'neg', 2: 'add', 3: 'sub', 4: 'mul', 5: 'div', 6: 'odd',
+    7: 'eq', 8: 'ne', 9: 'lt', 10: 'ge', 11: 'gt', 12: 'le',
+}
+
+
+def instruction_kind(code):
+    """ OpCode name of a pcode, followed by the operation for OPR, LOP and CJP
+    """
+    if code.f == OpCode.OPR:
+        return 'OPR %s' % operation_names.get(code.a, code.a)
+    if code.f in (OpCode.LOP, OpCode.CJP):
+        return '%s %s' % (code.f, operation_names.get(code.l, code.l))
+    return str(code.f)
+
+
+class Profile:
+    """ Execution counts of a program run, per instruction, kind of instruction, source line and
+    procedure
+    lines and procedures are Parser.pcode.lines and Parser.procedures of the program, if it was
+    compiled from PL/0 source. The calls of a procedure are the executions of its first instruction.
+    """
+    def __init__(self, pcodes, counts, lines=None, procedures=None):
+        self.pcodes = pcodes
+        self.counts = counts
+        self.lines = lines
+        self.procedures = procedures or []
+
+    def by_kind(self):
+        kinds = dict()
+        for code, count in zip(self.pcodes, self.counts):
+            if count:
+                kind = instruction_kind(code)
+                kinds[kind] = kinds.get(kind, 0) + count
+        return kinds
+
+    def by_line(self):
+        lines = dict()
+        for line, count in zip(self.lines or [], self.counts):
+            lines[line] = lines.get(line, 0) + count
+        return lines
+
+    def calls(self):
+        return [{'name': procedure.name, 'address': procedure.address, 'calls': self.counts[procedure.address]}
+                for procedure in self.procedures]
+
+    def to_dict(self):
+        instructions = []
+        for pc, (code, count) in enumerate(zip(self.pcodes, self.counts)):
+            instructions.append({'pc': pc, 'code': str(code), 'count': count,
+                                 'line': self.lines[pc] if self.lines else None})
+        return {
+            'total': sum(self.counts),
+            'instructions': instructions,
+            'kinds': self.by_kind(),
+            'lines': [{'line': line, 'count': count} for line, count in sorted(self.by_line().items())],
+            'procedures': self.calls(),
+        }
+
+
+def profile(pcodes, in_=(), lines=None, procedures=None, out=None, err=None, **limits):
+    """ Run pcodes with profiling on, limits are passed to the interpreter
+    Returns the interpreter, whose error, steps and elapsed describe the run, and the Profile
+    """
+    interpreter = ThreadedInterpreter(**limits)
+    interpreter.profiling = True
+    interpreter.in_ = in_
+    interpreter.interpret(pcodes, out=out, err=err)
+    counts = interpreter.counts or [0] * len(pcodes)  # None if the program could not be decoded
+    return interpreter, Profile(pcodes, counts, lines, procedures)
@@ -0,0 +1,113 @@
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import StringIO
+from multiprocessing import Pipe, Process
+from threading import BoundedSemaphore, Lock
+from compiler.interpreter import engines
+from compiler.exceptions import LimitExceeded
+from compiler import vectorized
+import os
+
+
+def _run(sender, pcodes, in_, engine, limits):
+    s = StringIO()
+    t = StringIO()
+    interpreter = engines[engine](**limits)
+    interpreter.in_ = in_
+    interpreter.interpret(pcodes, out=s, err=t)
+    sender.send((s.getvalue(), t.getvalue()))
+
+
+class Sandbox:
+    """ Runs p-code in worker processes, at most max_workers at a time
+    Every run gets a process of its own, so concurrent runs cannot interfere. The interpreter stops
+    the program after timeout seconds, max_steps instructions or when the stack outgrows max_stack,
+    and the process is killed if it has not answered a second after the timeout.
+    """
+    def __init__(self, max_workers=4, timeout=5.0, max_steps=10000000, max_stack=1000000, engine='threaded'):
+        self.slots = BoundedSemaphore(max_workers)
+        self.timeout = timeout
+        self.max_steps = max_steps
+        self.max_stack = max_stack
+        self.engine = engine
+
+    def run(self, pcodes, in_):
+        """ Returns the output and the errors of the program
+        """
+        with self.slots:
+            receiver, sender = Pipe(duplex=False)
+            limits = dict(max_steps=self.max_steps, max_stack=self.max_stack, max_time=self.timeout)
+            process = Process(target=_run, args=(sender, pcodes, in_, self.engine, limits), daemon=True)
+            process.start()
+            sender.close()
+            try:
+                if receiver.poll(self.timeout + 1):
+                    return receiver.recv()
+                return '', 'Time limit exceeded\n'
+            except EOFError:
+                return '', 'Program terminated unexpectedly\n'
+            finally:
+                receiver.close()
+                process.kill()
+                process.join()
+
+
+POOL_WORKERS = os.cpu_count() or 1
+_pool = None  # the worker processes of run_batch, shared by every batch
+_pool_lock = Lock()
+
+
+def _shared_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(POOL_WORKERS)
+        return _pool
+
+
+def _run_case(pcodes, engine, limits, in_):
+    s = StringIO()
+    t = StringIO()
+    interpreter = engines[engine](**limits)
+    interpreter.in_ = in_.split()
+    interpreter.interpret(pcodes, out=s, err=t)
+    if interpreter.error is None:
+        status = 'ok'
+    elif isinstance(interpreter.error, LimitExceeded):
+        status = 'limit'
+    else:
+        status = 'error'
+    return dict(output=s.getvalue(), error=t.getvalue(), status=status,
+                steps=interpreter.steps, time=interpreter.elapsed)
+
+
+def _run_cases(pcodes, engine, limits, inputs):
+    return [_run_case(pcodes, engine, limits, in_) for in_ in inputs]
+
+
+def run_batch(pcodes, inputs, engine='threaded', **limits):
+    """ Run one program on each of the input strings in the worker processes shared by all batches
+    The pool has POOL_WORKERS processes, so concurrent batches wait for each other instead of starting
+    processes of their own. The cases are split in parts, each sent to a worker with the program
+    pickled. limits are passed to the interpreter. Returns, in the order of inputs, a dict per case
+    with the output, the error message, the status ('ok', 'error' or 'limit'), the number of
+    instructions executed and the run time.
+    The engine 'lockstep' runs every case together in this process, see compiler.vectorized, and falls
+    back to 'reference' when NumPy is not installed.
+    """
+    global _pool
+    if engine == 'lockstep':
+        if vectorized.numpy is not None:
+            return vectorized.run_batch(pcodes, inputs, **limits)
+        engine = 'reference'
+    pool = _shared_pool()
+    size = max(1, len(inputs) // (4*POOL_WORKERS))
+    try:
+        parts = [pool.submit(_run_cases, pcodes, engine, limits, inputs[i:i+size])
+                 for i in range(0, len(inputs), size)]
+        return [case for part in parts for case in part.result()]
+    except BrokenProcessPool:  # a worker died, the next batch gets a new pool
+        with _pool_lock:
+            if _pool is pool:
+                _pool = None
+        raise
@@ -0,0 +1,439 @@
+from compiler.lexer import Token
+from compiler.exceptions import *
+
+
+class Node:
+    """ Node of the syntax tree of a PL/0 program
+    pos is the source position errors about the node are reported at, as Parser would report them,
+    and line (lines for nodes generating several pcodes) the source line of the pcode it generates.
+    Nodes are never changed once built, so a tree can be cached and compiled any number of times.
+    """
+    __slots__ = ('pos',)
+
+    def __repr__(self):
+        return '%s(%s)' % (type(self).__name__, ', '.join(
+            '%s=%r' % (name, getattr(self, name)) for cls in type(self).__mro__
+            for name in getattr(cls, '__slots__', ()) if name not in ('pos', 'line', 'lines')))
+
+
+class Program(Node):
+    __slots__ = ('block',)
+
+    def __init__(self, block, pos):
+        self.block = block
+        self.pos = pos
+
+
+class Block(Node):
+    """ lines are those of its JMP, INT and return
+    """
+    __slots__ = ('consts', 'vars', 'procedures', 'body', 'lines')
+
+    def __init__(self, consts, vars_, procedures, body, pos, lines):
+        self.consts = consts
+        self.vars = vars_
+        self.procedures = procedures
+        self.body = body  # a statement, None for the empty statement
+        self.pos = pos
+        self.lines = lines
+
+
+class Const(Node):
+    __slots__ = ('name', 'value')
+
+    def __init__(self, name, value, pos):
+        self.name = name
+        self.value = value
+        self.pos = pos
+
+
+class Var(Node):
+    __slots__ = ('name',)
+
+    def __init__(self, name, pos):
+        self.name = name
+        self.pos = pos
+
+
+class Procedure(Node):
+    __slots__ = ('name', 'block')
+
+    def __init__(self, name, block, pos):
+        self.name = name
+        self.block = block
+        self.pos = pos
+
+
+class Assign(Node):
+    __slots__ = ('name', 'expression', 'line')
+
+    def __init__(self, name, expression, pos, line):
+        self.name = name
+        self.expression = expression
+        self.pos = pos
+        self.line = line
+
+
+class If(Node):
+    """ lines are those of its JPC and JMP
+    """
+    __slots__ = ('condition', 'then', 'else_', 'lines')
+
+    def __init__(self, condition, then, else_, pos, lines):
+        self.condition = condition
+        self.then = then
+        self.else_ = else_
+        self.pos = pos
+        self.lines = lines
+
+
+class While(Node):
+    """ lines are those of its JPC and JMP
+    """
+    __slots__ = ('condition', 'body', 'lines')
+
+    def __init__(self, condition, body, pos, lines):
+        self.condition = condition
+        self.body = body
+        self.pos = pos
+        self.lines = lines
+
+
+class Call(Node):
+    __slots__ = ('name', 'line')
+
+    def __init__(self, name, pos, line):
+        self.name = name
+        self.pos = pos
+        self.line = line
+
+
+class Begin(Node):
+    __slots__ = ('statements',)
+
+    def __init__(self, statements, pos):
+        self.statements = statements
+        self.pos = pos
+
+
+class Repeat(Node):
+    __slots__ = ('statements', 'condition', 'line')
+
+    def __init__(self, statements, condition, pos, line):
+        self.statements = statements
+        self.condition = condition
+        self.pos = pos
+        self.line = line
+
+
+class Read(Node):
+    __slots__ = ('names',)
+
+    def __init__(self, names, pos):
+        self.names = names  # Name nodes
+        self.pos = pos
+
+
+class Write(Node):
+    """ lines are those of its WRTs
+    """
+    __slots__ = ('expressions', 'lines')
+
+    def __init__(self, expressions, pos, lines):
+        self.expressions = expressions
+        self.pos = pos
+        self.lines = lines
+
+
+class Odd(Node):
+    __slots__ = ('operand', 'line')
+
+    def __init__(self, operand, pos, line):
+        self.operand = operand
+        self.pos = pos
+        self.line = line
+
+
+class Binary(Node):
+    """ An arithmetic operation or a comparison, op is its OPR operation
+    """
+    __slots__ = ('op', 'left', 'right', 'line')
+
+    def __init__(self, op, left, right, pos, line):
+        self.op = op
+        self.left = left
+        self.right = right
+        self.pos = pos
+        self.line = line
+
+
+class Negative(Node):
+    __slots__ = ('operand', 'line')
+
+    def __init__(self, operand, pos, line):
+        self.operand = operand
+        self.pos = pos
+        self.line = line
+
+
+class Number(Node):
+    __slots__ = ('value', 'line')
+
+    def __init__(self, value, pos, line):
+        self.value = value
+        self.pos = pos
+        self.line = line
+
+
+class Name(Node):
+    """ A constant or variable in an expression, or a variable read
+    """
+    __slots__ = ('name', 'line')
+
+    def __init__(self, name, pos, line):
+        self.name = name
+        self.pos = pos
+        self.line = line
+
+
+# OPR operation of each operator
+operations = {'+': 2, '-': 3, '*': 4, '/': 5, '=': 7, '<>': 8, '<': 9, '>=': 10, '>': 11, '<=': 12}
+
+
+class TreeParser:
+    """ Recursive-descent parser building the syntax tree of a program, without resolving names
+    It follows the grammar of Parser, and raises the same errors for syntax errors.
+    """
+    def __init__(self, lexer, token_generator):
+        self.lexer = lexer
+        self.token_generator = token_generator
+        self.current_token = None
+        self.line = 1  # line of the last token consumed, as PCodeManager.line in Parser
+
+    def parse(self):
+        self._forward()
+        pos = self._pos()
+        block = self._block()
+        self._expect(Token(None, '.'))
+        return Program(block, pos)
+
+    def _pos(self):
+        return list(self.lexer.pos)
+
+    def _block(self):
+        pos = self._pos()
+        jmp_line = self.line
+        consts = []
+        vars_ = []
+        procedures = []
+        if self.current_token.value == 'const':
+            self._forward()
+            while True:
+                self._expect(Token('IDENTIFIER', None))
+                name = self.current_token.value
+                self._forward()
+                self._expect(Token(None, '='))
+                self._forward()
+                self._expect(Token('NUMBER', None))
+                consts.append(Const(name, int(self.current_token.value), self._pos()))
+                self._forward()
+                if self.current_token.value == ',':
+                    self._forward()
+                else:
+                    break
+            self._expect(Token(None, ';'))
+            self._forward()
+        if self.current_token.value == 'var':
+            self._forward()
+            while True:
+                self._expect(Token('IDENTIFIER', None))
+                vars_.append(Var(self.current_token.value, self._pos()))
+                self._forward()
+                if self.current_token.value == ',':
+                    self._forward()
+                else:
+                    break
+            self._expect(Token(None, ';'))
+            self._forward()
+        while self.current_token.value == 'procedure':
+            self._forward()
+            self._expect(Token('IDENTIFIER', None))
+            name = self.current_token.value
+            procedure_pos = self._pos()
+            self._forward()
+            self._expect(Token(None, ';'))
+            self._forward()
+            procedures.append(Procedure(name, self._block(), procedure_pos))
+            self._expect(Token(None, ';'))
+            self._forward()
+        int_line = self.line
+        body = self._statement()
+        return Block(consts, vars_, procedures, body, pos, (jmp_line, int_line, self.line))
+
+    def _statement(self):
+        pos = self._pos()
+        if self.current_token.type == 'IDENTIFIER':
+            name = self.current_token.value
+            self._forward()
+            self._expect(Token(None, ':='))
+            self._forward()
+            expression = self._expression()
+            return Assign(name, expression, pos, self.line)
+
+        elif self.current_token.value == 'if':
+            self._forward()
+            condition = self._condition()
+            self._expect(Token(None, 'then'))
+            self._forward()
+            jpc_line = self.line
+            then = self._statement()
+            jmp_line = self.line
+            else_ = None
+            if self.current_token.value == 'else':
+                self._forward()
+                else_ = self._statement()
+            return If(condition, then, else_, pos, (jpc_line, jmp_line))
+
+        elif self.current_token.value == 'while':
+            self._forward()
+            condition = self._condition()
+            jpc_line = self.line
+            self._expect(Token(None, 'do'))
+            self._forward()
+            body = self._statement()
+            return While(condition, body, pos, (jpc_line, self.line))
+
+        elif self.current_token.value == 'call':
+            self._forward()
+            self._expect(Token('IDENTIFIER', None))
+            node = Call(self.current_token.value, self._pos(), self.line)
+            self._forward()
+            return node
+
+        elif self.current_token.value == 'begin':
+            self._forward()
+            statements = [self._statement()]
+            while self.current_token.value == ';':
+                self._forward()
+                statements.append(self._statement())
+            self._expect(Token(None, 'end'))
+            self._forward()
+            return Begin(statements, pos)
+
+        elif self.current_token.value == 'repeat':
+            self._forward()
+            statements = [self._statement()]
+            while self.current_token.value == ';':
+                self._forward()
+                statements.append(self._statement())
+            self._expect(Token(None, 'until'))
+            self._forward()
+            condition = self._condition()
+            return Repeat(statements, condition, pos, self.line)
+
+        elif self.current_token.value == 'read':
+            self._forward()
+            self._expect(Token(None, '('))
+            self._forward()
+            names = []
+            while True:
+                self._expect(Token('IDENTIFIER', None))
+                names.append(Name(self.current_token.value, self._pos(), self.line))
+                self._forward()
+                if self.current_token.value != ',':
+                    break
+                else:
+                    self._forward()
+            self._expect(Token(None, ')'))
+            self._forward()
+            return Read(names, pos)
+
+        elif self.current_token.value == 'write':
+            self._forward()
+            self._expect(Token(None, '('))
+            self._forward()
+            expressions = []
+            lines = []
+            while True:
+                expressions.append(self._expression())
+                lines.append(self.line)
+                if self.current_token.value != ',':
+                    break
+                else:
+                    self._forward()
+            self._expect(Token(None, ')'))
+            self._forward()
+            return Write(expressions, pos, lines)
+
+    def _condition(self):
+        pos = self._pos()
+        if self.current_token.value == 'odd':
+            self._forward()
+            operand = self._expression()
+            return Odd(operand, pos, self.line)
+        left = self._expression()
+        self._expect(Token('RELATIONAL_OPERATOR', None))
+        op = self.current_token.value
+        self._forward()
+        right = self._expression()
+        return Binary(operations[op], left, right, pos, self.line)
+
+    def _expression(self):
+        pos = self._pos()
+        if self.current_token.type == 'PLUS_OPERATOR':  # unary operator
+            op = self.current_token.value
+            self._forward()
+            node = self._term()
+            if op == '-':
+                node = Negative(node, pos, self.line)
+        else:
+            node = self._term()
+        while self.current_token.type == 'PLUS_OPERATOR':  # binary operator
+            op = self.current_token.value
+            self._forward()
+            node = Binary(operations[op], node, self._term(), pos, self.line)
+        return node
+
+    def _term(self):
+        pos = self._pos()
+        node = self._factor()
+        while self.current_token.type == 'MULTIPLY_OPERATOR':
+            op = self.current_token.value
+            self._forward()
+            node = Binary(operations[op], node, self._factor(), pos, self.line)
+        return node
+
+    def _factor(self):
+        if self.current_token.type == 'IDENTIFIER':
+            node = Name(self.current_token.value, self._pos(), self.line)
+            self._forward()
+            return node
+        elif self.current_token.type == 'NUMBER':
+            node = Number(int(self.current_token.value), self._pos(), self.line)
+            self._forward()
+            return node
+        else:
+            self._expect(Token(None, '('))
+            self._forward()
+            node = self._expression()
+            self._expect(Token(None, ')'))
+            self._forward()
+            return node
+
+    def _forward(self):
+        self.line = self.lexer.pos[0]
+        try:
+            self.current_token = next(self.token_generator)
+        except StopIteration:
+            raise ParserError('unexpected end of program', self.lexer.pos)
+
+    def _expect(self, token):
+        if token.type is None:
+            b = token.value == self.current_token.value
+        elif token.value is None:
+            b = token.type == self.current_token.type
+        else:
+            b = token == self.current_token
+        if not b:
+            raise ParserError('Expecting "%s" but current token is "%s"' % (str(token.value), str(self.current_token.value)),
+                              self.lexer.pos)
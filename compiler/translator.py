@@ -0,0 +1,268 @@
+from compiler.pcode import OpCode
+from compiler.exceptions import LimitExceeded
+from compiler.utilities import LRUCache
+from compiler import pcode
+
+# Python operators of the binary OPR operations, applied to x (the second topmost value) and y
+binary_operators = {2: '+', 3: '-', 4: '*', 5: '//', 7: '==', 8: '!=', 9: '<', 10: '>=', 11: '>', 12: '<='}
+comparisons = (7, 8, 9, 10, 11, 12)
+
+# statuses returned by the generated function
+FINISHED = 0  # main returned
+LIMIT = 1  # the block at pc would run past limit
+INPUT = 2  # the RED at pc has no input
+UNKNOWN = 3  # pc is not the address of a block
+
+MAX_INSTRUCTIONS = 100000  # longer programs are not translated
+
+translations = LRUCache(64)  # by binary p-code
+
+
+class Translation:
+    """ A p-code program translated into the Python function run
+    run(S, pc, bp, steps, limit, inputs, write, max_stack) runs the program from the block at pc,
+    with the stack S and the base pointer bp, and returns (status, pc, bp, steps) once it finished or
+    cannot go on: the next block would take steps past limit, an instruction reads when inputs is
+    empty, or pc is not a block address. write is called with the output.
+    sizes is the number of instructions of each block by address, and lines the instruction each
+    line of source belongs to, so that errors can be traced back to the p-code.
+    """
+    def __init__(self, source, sizes, lines, block):
+        self.source = source
+        self.sizes = sizes
+        self.lines = lines
+        self.block = block  # address of the block of each instruction
+        namespace = {'LimitExceeded': LimitExceeded}
+        exec(compile(source, '<p-code>', 'exec'), namespace)
+        self.run = namespace['run']
+
+    def locate(self, error):
+        """ The instruction that raised error in run and the steps executed up to it included, or
+        None if it was not raised by an instruction
+        """
+        tb = error.__traceback__
+        frame = None
+        while tb is not None:
+            if tb.tb_frame.f_code is self.run.__code__:
+                frame = tb
+            tb = tb.tb_next
+        if frame is None or self.lines[frame.tb_lineno-1] is None:
+            return None
+        i = self.lines[frame.tb_lineno-1]
+        start = self.block[i]
+        return i, frame.tb_frame.f_locals['steps'] - self.sizes[start] + i - start + 1
+
+
+class Translator:
+    """ Generates the source of Translation.run
+    Each block is straight-line code. The values it pushes stay in local variables as long as their
+    depth is known, and only go to S when a block ends with values left or an instruction needs the
+    real stack. Blocks are selected by a binary tree of comparisons on pc.
+    """
+    def __init__(self, pcodes):
+        self.pcodes = pcodes
+        self.lines = []  # (indent, text, instruction)
+        self.values = []  # expressions of the values above S, topmost last
+        self.temp = 0
+
+    def emit(self, indent, text, i=None):
+        self.lines.append((indent, text, i))
+
+    def leaders(self):
+        n = len(self.pcodes)
+        leaders = {0}
+        for i, code in enumerate(self.pcodes):
+            if code.f in (OpCode.JMP, OpCode.JPC, OpCode.CJP, OpCode.CAL):
+                if 0 <= code.a < n:
+                    leaders.add(code.a)
+                leaders.add(i+1)
+            elif code.f == OpCode.OPR and code.a == 0:
+                leaders.add(i+1)
+            elif code.f == OpCode.RED:  # so that the program can stop and continue there
+                leaders.add(i)
+        return sorted(leader for leader in leaders if leader < n)
+
+    def check(self):
+        """ Whether the program can be translated
+        """
+        if len(self.pcodes) > MAX_INSTRUCTIONS:
+            return False
+        for code in self.pcodes:
+            if code.f in (OpCode.LOP, OpCode.CJP) and code.l not in binary_operators:
+                return False
+            if not isinstance(code.l, int) or not isinstance(code.a, int):
+                return False
+        return True
+
+    def new_temp(self):
+        self.temp += 1
+        return 't%d' % self.temp
+
+    def base(self, l):
+        expression = 'bp'
+        for k in range(l):
+            expression = 'S[%s]' % expression
+        return expression
+
+    def pop(self, indent, i):
+        if self.values:
+            return self.values.pop()
+        t = self.new_temp()
+        self.emit(indent, '%s = S.pop()' % t, i)
+        return t
+
+    def push(self, indent, expression, i):
+        t = self.new_temp()
+        self.emit(indent, '%s = %s' % (t, expression), i)
+        self.values.append(t)
+
+    def flush(self, indent, i):
+        if len(self.values) == 1:
+            self.emit(indent, 'S.append(%s)' % self.values[0], i)
+        elif self.values:
+            self.emit(indent, 'S += (%s)' % ', '.join(self.values), i)
+        self.values = []
+
+    def jump(self, indent, target, i):
+        if target == 0:
+            self.emit(indent, 'return %d, 0, bp, steps' % FINISHED, i)
+        else:
+            self.emit(indent, 'pc = %d' % target, i)
+
+    def block(self, indent, start, end):
+        """ Source of the block of instructions from start to end (excluded)
+        """
+        size = end - start
+        self.emit(indent, 'if steps + %d > limit:' % size)
+        self.emit(indent+1, 'return %d, %d, bp, steps' % (LIMIT, start))
+        self.emit(indent, 'steps += %d' % size)
+        self.values = []
+        self.temp = 0
+        for i in range(start, end):
+            code = self.pcodes[i]
+            f, l, a = code.f, code.l, code.a
+            n = i + 1
+            if f == OpCode.LIT:
+                self.values.append(repr(a))
+            elif f == OpCode.LOD:
+                self.push(indent, 'S[%s + %d]' % (self.base(l), a), i)
+            elif f == OpCode.STO:
+                self.emit(indent, 'S[%s + %d] = %s' % (self.base(l), a, self.pop(indent, i)), i)
+            elif f == OpCode.LOP:
+                x = self.pop(indent, i)
+                self.operation(indent, l, x, repr(a), i)
+            elif f == OpCode.OPR and a in binary_operators:
+                y = self.pop(indent, i)
+                x = self.pop(indent, i)
+                self.operation(indent, a, x, y, i)
+            elif f == OpCode.OPR and a == 1:
+                self.push(indent, '-%s' % self.pop(indent, i), i)
+            elif f == OpCode.OPR and a == 6:
+                self.push(indent, '%s %% 2' % self.pop(indent, i), i)
+            elif f == OpCode.OPR and a == 0:  # return
+                self.flush(indent, i)
+                self.emit(indent, 'pc = S[bp + 2]', i)
+                self.emit(indent, 'dynamic_link = S[bp + 1]', i)
+                self.emit(indent, 'del S[bp:]', i)
+                self.emit(indent, 'bp = dynamic_link', i)
+                self.emit(indent, 'if pc == 0:', i)
+                self.emit(indent+1, 'return %d, 0, bp, steps' % FINISHED, i)
+                return
+            elif f == OpCode.OPR:
+                pass
+            elif f == OpCode.INT:
+                self.flush(indent, i)
+                if a > 3:
+                    self.emit(indent, 'S += [0] * %d' % (a-3), i)
+                self.emit(indent, 'if len(S) > max_stack:', i)
+                self.emit(indent+1, "raise LimitExceeded('Stack limit exceeded', %d, len(S))" % i, i)
+            elif f == OpCode.RED:
+                self.flush(indent, i)
+                self.emit(indent, 'if not inputs:', i)
+                self.emit(indent+1, 'return %d, %d, bp, steps - %d' % (INPUT, i, end - i), i)
+                self.emit(indent, 'S[%s + %d] = int(inputs[0])' % (self.base(l), a), i)
+                self.emit(indent, 'inputs.popleft()', i)
+            elif f == OpCode.WRT:
+                top = self.values[-1] if self.values else 'S[len(S)-1]'
+                self.emit(indent, "write('[Out] %%s\\n' %% %s)" % top, i)
+            elif f == OpCode.JMP:
+                self.flush(indent, i)
+                self.jump(indent, a, i)
+                return
+            elif f in (OpCode.JPC, OpCode.CJP):
+                if f == OpCode.JPC:
+                    condition = '%s != 0' % self.pop(indent, i)
+                else:
+                    y = self.pop(indent, i)
+                    condition = '%s %s %s' % (self.pop(indent, i), binary_operators[l], y)
+                self.flush(indent, i)
+                self.emit(indent, 'if %s:' % condition, i)
+                self.jump(indent+1, n, i)
+                self.emit(indent, 'else:', i)
+                self.jump(indent+1, a, i)
+                return
+            elif f == OpCode.CAL:
+                self.flush(indent, i)
+                self.emit(indent, 'S += (%s, bp, %d)' % (self.base(l), n), i)
+                self.emit(indent, 'bp = len(S) - 3', i)
+                self.jump(indent, a, i)
+                return
+        self.flush(indent, end-1)
+        self.emit(indent, 'pc = %d' % end, end-1)
+
+    def operation(self, indent, operation, x, y, i):
+        if operation in comparisons:
+            self.push(indent, '1 if %s %s %s else 0' % (x, binary_operators[operation], y), i)
+        else:
+            self.push(indent, '%s %s %s' % (x, binary_operators[operation], y), i)
+
+    def tree(self, indent, blocks):
+        """ Dispatch to the blocks, a list of (start, end), by binary search on pc
+        """
+        if len(blocks) <= 4:
+            for k, (start, end) in enumerate(blocks):
+                self.emit(indent, '%s pc == %d:' % ('if' if k == 0 else 'elif', start))
+                self.block(indent+1, start, end)
+                self.emit(indent+1, 'continue')
+            return
+        middle = len(blocks) // 2
+        self.emit(indent, 'if pc < %d:' % blocks[middle][0])
+        self.tree(indent+1, blocks[:middle])
+        self.emit(indent, 'else:')
+        self.tree(indent+1, blocks[middle:])
+
+    def translate(self):
+        """ The Translation of the program, or None if it cannot be translated
+        """
+        if not self.check():
+            return None
+        leaders = self.leaders()
+        blocks = list(zip(leaders, leaders[1:] + [len(self.pcodes)]))
+        self.emit(0, 'def run(S, pc, bp, steps, limit, inputs, write, max_stack):')
+        self.emit(1, 'while True:')
+        if blocks:
+            self.tree(2, blocks)
+        self.emit(2, 'return %d, pc, bp, steps' % UNKNOWN)
+        source = ''.join('    ' * indent + text + '\n' for indent, text, i in self.lines)
+        sizes = {start: end - start for start, end in blocks}
+        block = [0] * len(self.pcodes)
+        for start, end in blocks:
+            block[start:end] = [start] * (end - start)
+        try:
+            return Translation(source, sizes, [i for indent, text, i in self.lines], block)
+        except (SyntaxError, RecursionError, MemoryError):
+            return None
+
+
+def translate(pcodes):
+    """ Translation of pcodes, cached by program, or None if it cannot be translated
+    """
+    try:
+        key = pcode.dumps(pcodes)
+    except (AttributeError, TypeError, ValueError):  # not representable in the binary format
+        return Translator(pcodes).translate()
+    translation = translations.get(key)
+    if translation is None:
+        translation = Translator(pcodes).translate() or False
+        translations.put(key, translation)
+    return translation or None
@@ -1,3 +1,9 @@
+from collections import OrderedDict
+from threading import Lock
+import secrets
+import time
+
+
 class Logger(object):
     def __init__(self, f):
         self.f = f
@@ -13,3 +19,89 @@ class Logger(object):
 
     info = critical
     debug = critical
+
+
+class LRUCache(object):
+    """ A bounded mapping that evicts the least recently used entry when it is full
+    It is shared by request handlers, so every access takes the lock.
+    """
+    def __init__(self, max_size=256):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key in self.entries:
+                self.hits += 1
+                self.entries.move_to_end(key)
+                return self.entries[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def stats(self):
+        with self.lock:
+            return {'size': len(self.entries), 'max_size': self.max_size, 'hits': self.hits, 'misses': self.misses}
+
+
+class SessionStore(LRUCache):
+    """ An LRUCache that also evicts entries which have not been used for max_idle seconds
+    Keys of new entries are random, so they can be handed out to clients.
+    """
+    def __init__(self, max_size=256, max_idle=600.0):
+        LRUCache.__init__(self, max_size)
+        self.max_idle = max_idle
+
+    def get(self, key, default=None):
+        with self.lock:
+            self._expire()
+            if key in self.entries:
+                self.hits += 1
+                self.entries[key] = (time.monotonic(), self.entries[key][1])
+                self.entries.move_to_end(key)
+                return self.entries[key][1]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        with self.lock:
+            self._expire()
+            self.entries[key] = (time.monotonic(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def pop(self, key, default=None):
+        """ Remove an entry and return it, so that a single request uses it at a time
+        """
+        with self.lock:
+            self._expire()
+            if key in self.entries:
+                self.hits += 1
+                return self.entries.pop(key)[1]
+            self.misses += 1
+            return default
+
+    def add(self, value):
+        """ Store value under a new key and return the key
+        """
+        key = secrets.token_urlsafe(16)
+        self.put(key, value)
+        return key
+
+    def _expire(self):
+        deadline = time.monotonic() - self.max_idle
+        while self.entries and next(iter(self.entries.values()))[0] < deadline:
+            self.entries.popitem(last=False)
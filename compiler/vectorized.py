@@ -0,0 +1,298 @@
+""" Lockstep execution of one p-code program on many inputs with NumPy
+Every run is a lane, and the state of all lanes is kept in arrays. At each step the lanes at the lowest
+program counter execute its instruction together, so lanes that took different branches wait for each
+other and run together again once they are back at the same instruction. RED and WRT are run lane by
+lane. A lane leaves the lockstep for Interpreter whenever it would do something the arrays cannot
+follow exactly: an error, a limit, a stack deeper than stack_size, or a value that does not fit in
+64 bits. Interpreter continues it from the same state, so every lane gives the same output, errors and
+steps as a run of Interpreter of its own.
+"""
+from compiler.interpreter import Interpreter
+from compiler.pcode import OpCode, binary_operations
+from compiler.exceptions import LimitExceeded
+from collections import deque
+from io import StringIO
+import time
+
+try:
+    import numpy
+except ImportError:  # the lockstep engine is optional
+    numpy = None
+
+INT64_MIN = -2 ** 63
+INT64_MAX = 2 ** 63 - 1
+
+
+def fits(value):
+    return isinstance(value, int) and INT64_MIN <= value <= INT64_MAX
+
+
+class LockstepInterpreter:
+    """ Runs one program on a list of inputs at once, see the module
+    Limits are those of Interpreter, except that max_time is for the whole batch. fallbacks is the
+    number of lanes of the last run that were finished by Interpreter.
+    """
+    def __init__(self, max_steps=None, max_stack=None, max_time=None, stack_size=256):
+        if numpy is None:
+            raise ImportError('LockstepInterpreter requires numpy')
+        self.max_steps = max_steps
+        self.max_stack = max_stack
+        self.max_time = max_time
+        self.stack_size = stack_size
+        self.fallbacks = 0
+
+    def run(self, pcodes, inputs):
+        """ Run pcodes on each list of input values of inputs
+        Returns a dict per lane with the output, the error message, the status ('ok', 'error' or
+        'limit'), the number of instructions executed and the run time, as sandbox.run_batch does.
+        """
+        self.started = time.monotonic()
+        self.pcodes = pcodes
+        self.inputs = [deque(values) for values in inputs]
+        self.outputs = [[] for values in inputs]
+        self.results = [None] * len(inputs)
+        self.fallbacks = 0
+        n = len(inputs)
+        self.stack = numpy.zeros((n, max(self.stack_size, 3)), numpy.int64)
+        self.sp = numpy.full(n, 3, numpy.int64)  # index of the first free slot of each lane
+        self.bp = numpy.zeros(n, numpy.int64)
+        self.pc = numpy.zeros(n, numpy.int64)
+        self.steps = numpy.zeros(n, numpy.int64)
+        self.running = numpy.ones(n, bool)
+        live = numpy.arange(n)
+        if not self._lockstep(pcodes):
+            self._leave(live)
+            return self.results
+        rounds = 0
+        with numpy.errstate(all='ignore'):
+            while len(live):
+                rounds += 1
+                if self.max_time is not None and rounds % 1024 == 0 and \
+                        time.monotonic() - self.started > self.max_time:
+                    for lane in live.tolist():
+                        self._finish(lane, 'Time limit exceeded at %d\n' % self.pc[lane], 'limit')
+                    break
+                pcs = self.pc[live]
+                p = int(pcs.min())
+                lanes = live if p == pcs.max() else live[pcs == p]
+                if not 0 <= p < len(pcodes):
+                    self._leave(lanes)
+                else:
+                    lanes = self._execute(p, self._limit(lanes))
+                    self.steps[lanes] += 1
+                    for lane in lanes[self.pc[lanes] == 0].tolist():  # main returned
+                        self._finish(lane, '', 'ok')
+                live = live[self.running[live]]
+        return self.results
+
+    def _lockstep(self, pcodes):
+        """ Whether the operands of every instruction fit in the arrays
+        """
+        for code in pcodes:
+            if not fits(code.l) or not fits(code.a):
+                return False
+            if code.f in (OpCode.LOP, OpCode.CJP) and code.l not in binary_operations:
+                return False
+        return True
+
+    def _limit(self, lanes):
+        """ Leave the lanes whose limits Interpreter would check and find exceeded, returns the others
+        """
+        steps = self.steps[lanes]
+        exceeded = numpy.zeros(len(lanes), bool)
+        if self.max_steps is not None:
+            exceeded |= steps >= self.max_steps
+        if self.max_stack is not None:
+            exceeded |= (steps % Interpreter.chunk == 0) & (self.sp[lanes] > self.max_stack)
+        return self._keep(lanes, exceeded)[0]
+
+    def _keep(self, lanes, leaving, *values):
+        """ Leave the lanes where leaving is set, returns the other lanes followed by their values
+        """
+        if leaving.any():
+            self._leave(lanes[leaving])
+            kept = ~leaving
+            return (lanes[kept],) + tuple(value[kept] for value in values)
+        return (lanes,) + values
+
+    def _leave(self, lanes):
+        """ Finish the lanes with Interpreter, from their current state
+        """
+        for lane in lanes.tolist():
+            sp = int(self.sp[lane])
+            interpreter = Interpreter(self.max_steps, self.max_stack)
+            if self.max_time is not None:
+                interpreter.max_time = max(self.max_time - (time.monotonic() - self.started), 0)
+            interpreter.inputs = self.inputs[lane]
+            interpreter.suspended = (self.pcodes, int(self.pc[lane]), int(self.bp[lane]),
+                                     self.stack[lane, :sp].tolist(), int(self.steps[lane]))
+            out = StringIO()
+            err = StringIO()
+            interpreter.resume((), out=out, err=err)
+            self.steps[lane] = interpreter.steps
+            self.outputs[lane].append(out.getvalue())
+            if interpreter.error is None:
+                status = 'ok'
+            elif isinstance(interpreter.error, LimitExceeded):
+                status = 'limit'
+            else:
+                status = 'error'
+            self._finish(lane, err.getvalue(), status, finished=False)
+            self.fallbacks += 1
+
+    def _finish(self, lane, error, status, finished=True):
+        if finished and status == 'ok':
+            self.outputs[lane].append('\nProgram finished!\n')
+        self.running[lane] = False
+        self.results[lane] = dict(output=''.join(self.outputs[lane]), error=error, status=status,
+                                  steps=int(self.steps[lane]), time=time.monotonic() - self.started)
+
+    def _base(self, lanes, l, size):
+        """ Base of the frame l levels down of each lane, and where following the static links leaves
+        the stack, of size values
+        """
+        base = self.bp[lanes]
+        outside = numpy.zeros(len(lanes), bool)
+        for i in range(l):
+            outside |= (base < 0) | (base >= size)
+            base = self.stack[lanes, numpy.clip(base, 0, self.stack.shape[1] - 1)]
+        return base, outside
+
+    def _binary(self, operation, x, y):
+        """ OPR operation on x and y, and where the result differs from Python's
+        """
+        if operation == 2:
+            result = x + y
+            wrong = ((x ^ result) & (y ^ result)) < 0
+        elif operation == 3:
+            result = x - y
+            wrong = ((x ^ y) & (x ^ result)) < 0
+        elif operation == 4:
+            result = x * y
+            wrong = numpy.abs(x.astype(numpy.float64) * y) >= 2.0 ** 62
+        elif operation == 5:
+            wrong = (y == 0) | (x == INT64_MIN) & (y == -1)  # Interpreter raises ZeroDivisionError
+            result = x // numpy.where(wrong, 1, y)
+        else:
+            result = binary_operations[operation](x, y).astype(numpy.int64)
+            wrong = numpy.zeros(len(x), bool)
+        return result, wrong
+
+    def _execute(self, p, lanes):
+        """ Run the instruction at p on lanes, returns the lanes that ran it
+        """
+        code = self.pcodes[p]
+        f, l, a = code.f, code.l, code.a
+        stack, sp, bp, pc = self.stack, self.sp, self.bp, self.pc
+        size = stack.shape[1]
+        top = sp[lanes]
+        following = p + 1
+        if f == OpCode.LIT:
+            lanes, top = self._keep(lanes, top >= size, top)
+            stack[lanes, top] = a
+            sp[lanes] = top + 1
+        elif f == OpCode.LOD:
+            base, outside = self._base(lanes, l, top)
+            address = base + a
+            lanes, top, address = self._keep(lanes, outside | (address < 0) | (address >= top) | (top >= size),
+                                             top, address)
+            stack[lanes, top] = stack[lanes, address]
+            sp[lanes] = top + 1
+        elif f == OpCode.STO:
+            base, outside = self._base(lanes, l, top - 1)  # the value is popped first
+            address = base + a
+            lanes, top, address = self._keep(lanes, outside | (top < 1) | (address < 0) | (address >= top - 1),
+                                             top, address)
+            stack[lanes, address] = stack[lanes, top - 1]
+            sp[lanes] = top - 1
+        elif f == OpCode.OPR and a == 0:  # return
+            base = bp[lanes]
+            lanes, base = self._keep(lanes, (base < 0) | (base + 2 >= top), base)
+            pc[lanes] = stack[lanes, base + 2]
+            bp[lanes] = stack[lanes, base + 1]
+            sp[lanes] = base
+            return lanes
+        elif f == OpCode.OPR and a in (1, 6):
+            lanes, top = self._keep(lanes, top < 1, top)
+            x = stack[lanes, top - 1]
+            if a == 1:
+                lanes, top, x = self._keep(lanes, x == INT64_MIN, top, x)
+                stack[lanes, top - 1] = -x
+            else:
+                stack[lanes, top - 1] = x % 2
+        elif f == OpCode.OPR and a in binary_operations or f == OpCode.CJP:
+            lanes, top = self._keep(lanes, top < 2, top)
+            result, wrong = self._binary(l if f == OpCode.CJP else a, stack[lanes, top - 2], stack[lanes, top - 1])
+            lanes, top, result = self._keep(lanes, wrong, top, result)
+            if f == OpCode.CJP:
+                sp[lanes] = top - 2
+                pc[lanes] = numpy.where(result == 0, a, following)
+                return lanes
+            stack[lanes, top - 2] = result
+            sp[lanes] = top - 1
+        elif f == OpCode.LOP:
+            lanes, top = self._keep(lanes, top < 1, top)
+            result, wrong = self._binary(l, stack[lanes, top - 1], numpy.int64(a))
+            lanes, top, result = self._keep(lanes, wrong, top, result)
+            stack[lanes, top - 1] = result
+        elif f == OpCode.CAL:
+            base, outside = self._base(lanes, l, top)
+            lanes, top, base = self._keep(lanes, outside | (top + 3 > size), top, base)
+            stack[lanes, top] = base
+            stack[lanes, top + 1] = bp[lanes]
+            stack[lanes, top + 2] = following
+            bp[lanes] = top
+            sp[lanes] = top + 3
+            pc[lanes] = a
+            return lanes
+        elif f == OpCode.INT:
+            count = max(a - 3, 0)  # because 3 spaces have been allocated in CAL
+            if self.max_stack is not None:
+                exceeded = top + count > self.max_stack
+                for lane in lanes[exceeded].tolist():  # stopped here, as Interpreter does
+                    self.steps[lane] += 1
+                    self._finish(lane, 'Stack limit exceeded at %d\n' % following, 'limit')
+                lanes, top = lanes[~exceeded], top[~exceeded]
+            lanes, top = self._keep(lanes, top + count > size, top)
+            if count:
+                stack[lanes[:, None], top[:, None] + numpy.arange(count)] = 0
+            sp[lanes] = top + count
+        elif f == OpCode.JMP:
+            pc[lanes] = a
+            return lanes
+        elif f == OpCode.JPC:
+            lanes, top = self._keep(lanes, top < 1, top)
+            sp[lanes] = top - 1
+            pc[lanes] = numpy.where(stack[lanes, top - 1] == 0, a, following)
+            return lanes
+        elif f == OpCode.RED:
+            base, outside = self._base(lanes, l, top)
+            address = base + a
+            outside |= (address < 0) | (address >= top)
+            values = []
+            for k, lane in enumerate(lanes.tolist()):  # input is read lane by lane
+                inputs = self.inputs[lane]
+                try:
+                    value = int(inputs[0]) if inputs and not outside[k] else None
+                except ValueError:
+                    value = None
+                if fits(value):
+                    inputs.popleft()
+                    values.append(value)
+                else:  # Interpreter fails, or the value needs more than 64 bits
+                    outside[k] = True
+            lanes, address = self._keep(lanes, outside, address)
+            stack[lanes, address] = values
+        elif f == OpCode.WRT:
+            lanes, top = self._keep(lanes, top < 1, top)
+            for lane, value in zip(lanes.tolist(), stack[lanes, top - 1].tolist()):
+                self.outputs[lane].append('[Out] %s\n' % value)
+        pc[lanes] = following
+        return lanes
+
+
+def run_batch(pcodes, inputs, max_steps=None, max_stack=None, max_time=None, stack_size=256):
+    """ Run one program on each of the input strings in lockstep, the same as sandbox.run_batch
+    """
+    interpreter = LockstepInterpreter(max_steps, max_stack, max_time, stack_size)
+    return interpreter.run(pcodes, [in_.split() for in_ in inputs])
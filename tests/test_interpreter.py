@@ -0,0 +1,55 @@
+from compiler.interpreter import Interpreter, engines
+from compiler.optimizer import Optimizer
+from tests.test_pcode import compile_
+from io import StringIO
+from unittest import mock
+import unittest
+
+PROGRAM = '''
+var n, r;
+procedure fact;
+    var k;
+    begin
+        if n <= 1 then r := 1
+        else begin k := n; n := n - 1; call fact; r := r * k end
+    end;
+begin
+    read(n);
+    call fact;
+    write(r, 1 + (2 + (3 + (4 + r / (n - 1)))))
+end.
+'''
+
+
+def run(engine, pcodes, values, **limits):
+    interpreter = engines[engine](**limits)
+    interpreter.in_ = values
+    s = StringIO()
+    t = StringIO()
+    interpreter.interpret(pcodes, out=s, err=t)
+    error = interpreter.error
+    return s.getvalue(), t.getvalue(), interpreter.steps, getattr(error, 'pc', None)
+
+
+class LimitTest(unittest.TestCase):
+    def assertSameLimits(self, program):
+        for level in (0, 3):
+            pcodes = Optimizer(level).optimize(compile_(program)) if level else compile_(program)
+            for values in (['1'], ['2'], ['6']):
+                for max_steps in (3, 11, 19, 40, 200):
+                    for max_stack in (3, 5, 8, None):
+                        expected = run('reference', pcodes, values, max_steps=max_steps, max_stack=max_stack)
+                        for engine in ('threaded', 'compiled', 'array'):
+                            self.assertEqual(run(engine, pcodes, values, max_steps=max_steps, max_stack=max_stack),
+                                             expected, (engine, level, values, max_steps, max_stack))
+
+    def test_tight_limits(self):
+        self.assertSameLimits(PROGRAM)
+
+    def test_checks_inside_blocks(self):
+        with mock.patch.object(Interpreter, 'chunk', 5):
+            self.assertSameLimits(PROGRAM)
+
+
+if __name__ == '__main__':
+    unittest.main()
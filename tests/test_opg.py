@@ -0,0 +1,39 @@
+from toy.opg import OPGEngine
+import unittest
+
+
+def engine(rules, functions=False):
+    opg_engine = OPGEngine()
+    opg_engine.import_rules(rules)
+    opg_engine.calc_priority_tab()
+    if functions:
+        assert opg_engine.calc_precedence_functions()
+    return opg_engine
+
+
+class PrecedenceFunctionsTest(unittest.TestCase):
+    def test_same_as_table(self):
+        rules = ['E->E+T|T', 'T->T*F|F', 'F->(E)|i']
+        for program in ('i+i*(i+i)', 'i*i+i', '(i', 'i+*i'):
+            self.assertEqual(engine(rules, True).accepts(program), engine(rules).accepts(program), program)
+
+    def test_table_replaced(self):
+        rules = ['E->E+T|T', 'T->T*F|F', 'F->(E)|i']
+        table = engine(rules)
+        self.assertEqual(table.memory()['saved_bytes'], 0)
+        functions = engine(rules, True)
+        self.assertEqual(functions.priority_tab, dict())
+        memory = functions.memory()
+        self.assertEqual(memory['representation'], 'functions')
+        self.assertEqual(memory['table_bytes'], table.memory()['table_bytes'])
+        self.assertEqual(memory['saved_bytes'], memory['table_bytes'] - memory['functions_bytes'])
+
+    def test_blank_entry(self):
+        # (')', '*') is blank in the table, the functions order it and accept the program
+        rules = ['E->T|+', 'T->+*|FS|)', 'F->T((', 'S->)|E)|F*']
+        self.assertFalse(engine(rules).accepts(')*'))
+        self.assertTrue(engine(rules, True).accepts(')*'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+from compiler.parser import Parser
+from compiler.interpreter import engines
+from io import StringIO
+import unittest
+
+
+def analyze(program, opt_level=0):
+    parser = Parser(opt_level)
+    parser.load_program(program)
+    err = StringIO()
+    pcodes = parser.analyze(out=StringIO(), err=err)
+    return pcodes, err.getvalue()
+
+
+def run(pcodes, values):
+    outputs = []
+    for engine in engines.values():
+        interpreter = engine()
+        interpreter.in_ = values
+        out, err = StringIO(), StringIO()
+        interpreter.interpret(pcodes, out=out, err=err)
+        outputs.append((out.getvalue(), err.getvalue()))
+    return outputs
+
+
+class OptimizerTest(unittest.TestCase):
+    def test_call_of_enclosing_procedure(self):
+        # the call of p in q has no address yet, the optimizer leaves the program as it is
+        program = '''
+            var n;
+            procedure p;
+                procedure q;
+                begin n := n - 1; if n > 0 then call p end;
+            begin write(n); call q end;
+            begin n := 3; call p end.'''
+        pcodes, errors = analyze(program)
+        for opt_level in (1, 2, 3):
+            optimized, errors = analyze(program, opt_level)
+            self.assertEqual(errors, '')
+            self.assertEqual([str(code) for code in optimized], [str(code) for code in pcodes])
+
+    def assertSameOutput(self, program, values):
+        pcodes, errors = analyze(program)
+        parser = Parser(3)
+        parser.load_program(program)
+        inlined = parser.analyze(out=StringIO(), err=StringIO())
+        self.assertGreater(parser.optimizer.inlined, 0)
+        for value in values:
+            self.assertEqual(run(inlined, [value]), run(pcodes, [value]))
+
+    def test_inline_in_recursive_caller(self):
+        # the variables of square go after k, which each activation of sum must keep
+        self.assertSameOutput('''
+            var n, r;
+            procedure square;
+                var t;
+                begin t := n * n; r := r + t end;
+            procedure sum;
+                var k;
+                begin
+                    if n > 0 then begin k := n; call square; n := n - 1; call sum; r := r + k end
+                end;
+            begin read(n); r := 0; call sum; write(r) end.''', ['0', '1', '4'])
+
+    def test_inline_outer_variables(self):
+        # leaf reads x of the main program and y of p, two and one levels up where it is declared
+        self.assertSameOutput('''
+            var x, r;
+            procedure p;
+                var y;
+                procedure leaf;
+                    var t;
+                    begin t := x + y; r := r + t; y := y + 1 end;
+                begin y := x * 2; call leaf; call leaf; write(y) end;
+            begin read(x); r := 0; call p; x := x + 1; call p; write(r) end.''', ['0', '5'])
+
+
+if __name__ == '__main__':
+    unittest.main()
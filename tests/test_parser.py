@@ -0,0 +1,78 @@
+from compiler.parser import Parser, Record, SymTable
+from compiler.exceptions import DuplicateSymbol, UndefinedSymbol, WrongSymbolType
+from io import StringIO
+import glob
+import os
+import unittest
+
+PROGRAMS = os.path.join(os.path.dirname(__file__), '..', 'doc', 'programs')
+ERRORS = {
+    'undefined symbol': 'var x; begin x := y end.',
+    'wrong symbol type': 'const c = 1; begin c := 2 end.',
+    'duplicate name': 'var x, x; begin x := 1 end.',
+    'missing .': 'var x; begin x := 1 end',
+}
+
+
+def analyze(program, syntax_tree):
+    parser = Parser(syntax_tree=syntax_tree)
+    parser.load_program(program)
+    out, err = StringIO(), StringIO()
+    parser.analyze(out=out, err=err)
+    return out.getvalue(), err.getvalue()
+
+
+class SymTableTest(unittest.TestCase):
+    def setUp(self):
+        # var x, y; procedure p; var x, z; ... as the parser enters them
+        self.table = SymTable()
+        self.table.enter(Record())
+        self.table.enter(Record('var', 'x', None, 0, 3))
+        self.table.enter(Record('var', 'y', None, 0, 4))
+        self.table.enter(Record('procedure', 'p', None, 0))
+        self.table.enter(Record('var', 'x', None, 1, 3))
+        self.table.enter(Record('var', 'z', None, 1, 4))
+
+    def test_lookup_across_levels(self):
+        self.assertEqual((self.table.get('y').level, self.table.get('y').address), (0, 4))
+        self.assertEqual(self.table.get('z').level, 1)
+        self.assertEqual(self.table.get('p', 'procedure').type, 'procedure')
+        with self.assertRaises(UndefinedSymbol):
+            self.table.get('w')
+        with self.assertRaises(WrongSymbolType):
+            self.table.get('p', 'var')
+
+    def test_duplicate_in_scope(self):
+        with self.assertRaises(DuplicateSymbol):
+            self.table.enter(Record('var', 'z', None, 1, 5))
+        self.table.enter(Record('var', 'y', None, 1, 5))  # hides the outer y
+
+    def test_inner_name_hides_outer(self):
+        self.assertEqual(self.table.get('x').level, 1)
+        self.table[4:] = []  # leaving p
+        self.assertEqual(self.table.get('x').level, 0)
+        with self.assertRaises(UndefinedSymbol):
+            self.table.get('z')
+        self.table.enter(Record('var', 'z', None, 0, 5))  # no longer a duplicate
+        self.assertEqual(self.table.get('z').level, 0)
+
+
+class SyntaxTreeTest(unittest.TestCase):
+    def test_same_as_one_pass(self):
+        programs = dict(ERRORS)
+        for path in sorted(glob.glob(os.path.join(PROGRAMS, '*.txt'))):
+            with open(path) as f:
+                programs[os.path.basename(path)] = f.read()
+        for name, program in programs.items():
+            with self.subTest(name):
+                self.assertEqual(analyze(program, True), analyze(program, False))
+
+    def test_errors_reported(self):
+        for name, program in ERRORS.items():
+            with self.subTest(name):
+                listing, errors = analyze(program, True)
+                self.assertIn('***', errors)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,33 @@
+from compiler.parser import Parser
+from compiler.pcode import OpCode, PCode
+from compiler import pcode
+from io import StringIO
+import unittest
+
+
+def compile_(program):
+    parser = Parser()
+    parser.load_program(program)
+    return parser.analyze(out=StringIO(), err=StringIO())
+
+
+class BinaryFormatTest(unittest.TestCase):
+    def test_round_trip(self):
+        pcodes = compile_('var x; begin read(x); write(x * 3000000000, -2147483649) end.')
+        loaded = pcode.loads(pcode.dumps(pcodes))
+        self.assertEqual([str(code) for code in loaded], [str(code) for code in pcodes])
+        self.assertIn(3000000000, [code.a for code in loaded])
+
+    def test_out_of_range(self):
+        with self.assertRaises(ValueError):
+            pcode.dumps([PCode(OpCode.LIT, 0, 2 ** 63)])
+
+    def test_old_version(self):
+        data = bytearray(pcode.dumps(compile_('begin write(1) end.')))
+        data[4] = 1
+        with self.assertRaises(ValueError):
+            pcode.loads(bytes(data))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,38 @@
+from toy.scanner import Scanner
+import time
+import unittest
+
+
+class LimitTest(unittest.TestCase):
+    def test_repetition_count(self):
+        self.assertEqual(len(Scanner([('a', 'a{255}')]).accept), 256)
+        with self.assertRaises(ValueError):
+            Scanner([('a', 'a{2000}')])
+        with self.assertRaises(ValueError):
+            Scanner([('a', 'a{1,2000}')])
+
+    def test_nested_repetition(self):
+        with self.assertRaises(ValueError):
+            Scanner([('a', '((a{255}){255}){2}')])
+
+    def test_dfa_states(self):
+        with self.assertRaises(ValueError):
+            Scanner([('ab', '(a|b)*a(a|b){16}')])
+
+    def test_large_alternation(self):
+        # one character class per alternative, built quickly or rejected
+        for n in (400, 1500, 5000):
+            started = time.monotonic()
+            try:
+                Scanner([('c', '(%s)*' % '|'.join(chr(0x100 + i) for i in range(n)))])
+            except ValueError:
+                pass
+            self.assertLess(time.monotonic() - started, 3)
+
+    def test_long_chain(self):
+        with self.assertRaises(ValueError):
+            Scanner([('chain', ''.join('%s{250}' % c for c in 'abcdefghijklmnopqrs'))])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,38 @@
+from compiler.interpreter import Interpreter
+from compiler import vectorized
+from tests.test_pcode import compile_
+from io import StringIO
+import unittest
+
+
+def solo(pcodes, values, **limits):
+    interpreter = Interpreter(**limits)
+    interpreter.in_ = values
+    s = StringIO()
+    t = StringIO()
+    interpreter.interpret(pcodes, out=s, err=t)
+    return s.getvalue(), t.getvalue(), interpreter.steps
+
+
+@unittest.skipIf(vectorized.numpy is None, 'NumPy is not installed')
+class LockstepTest(unittest.TestCase):
+    def assertSameAsSolo(self, program, inputs, **limits):
+        pcodes = compile_(program)
+        cases = vectorized.LockstepInterpreter(**limits).run(pcodes, [in_.split() for in_ in inputs])
+        for in_, case in zip(inputs, cases):
+            self.assertEqual((case['output'], case['error'], case['steps']),
+                             solo(pcodes, in_.split(), **limits))
+
+    def test_hand_off_over_max_stack(self):
+        # the lane dividing by zero leaves holding more than max_stack values, between two checks
+        self.assertSameAsSolo('var x; begin read(x); write(1 + (2 + (3 + 4 / x))) end.', ['1', '0'],
+                              max_steps=100, max_stack=5)
+
+    def test_hand_off_at_step_limit(self):
+        program = 'var x, i; begin read(x); i := 0; while i < x do i := i + 1; write(i) end.'
+        for max_steps in (7, 20, 33):
+            self.assertSameAsSolo(program, ['0', '3', '100'], max_steps=max_steps, max_stack=4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,5 @@
-import re
+from toy.scanner import Scanner
+import sys
 
 
 lexicon = [
@@ -11,34 +12,39 @@ lexicon = [
 ]
 
 
+def parse_lexicon(text):
+    """ Lexicon written one token per line, as its name and its regex separated by whitespace
+    """
+    result = []
+    for line in text.replace('\r', '').split('\n'):
+        parts = line.split(None, 1)
+        if parts:
+            result.append([parts[0], parts[1].strip() if len(parts) > 1 else ''])
+    return result
+
+
 class LexerEngine:
-    def __init__(self):
-        self.lexicon = []
-        for word in lexicon:
-            self.lexicon.append([word[0], re.compile(word[1])])
-
-    def process(self, program):
-        cur = 0
-        while cur < len(program):
-            max_length = 0
-            token = ()
-            for word in self.lexicon:
-                r = word[1].match(program[cur:])
-                if r and r.end() > max_length:
-                    max_length = r.end()
-                    token = (word[0], r.group())
-            cur += max_length
-            if max_length == 0:
-                print('Error at {}'.format(cur))
+    """ Tokenizes programs with the DFA compiled from a lexicon, the PL/0 one by default
+    The longest token wins, then the first of the lexicon. Tokens named blank are skipped.
+    """
+    def __init__(self, lexicon=lexicon):
+        self.lexicon = lexicon
+        self.scanner = Scanner(self.lexicon)
+
+    def process(self, program, out=None):
+        out = out or sys.stdout
+        for name, cur, end in self.scanner.tokens(program):
+            if name is None:
+                print('Error at {}'.format(cur), file=out)
                 break
-            if token[0] is 'blank':
+            text = program[cur:end]
+            if name == 'blank':
                 continue
-            elif token[0] is 'constant' and '.' not in token[1]:
+            elif name == 'constant' and text.isdigit():
                 # integer constant
-                print('{}\t{}'.format(token[0], bin(int(token[1]))))
+                print('{}\t{}'.format(name, bin(int(text))), file=out)
             else:
-                print('{}\t{}'.format(token[0], token[1]))
-                # print(token[0], token[1])
+                print('{}\t{}'.format(name, text), file=out)
 
     def error(self, pos):
         pass
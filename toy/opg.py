@@ -1,7 +1,13 @@
+from array import array
 from collections import namedtuple
-from collections import deque
+from itertools import islice
+import sys
 
 Rule = namedtuple('Rule', 'left, right')
+# a step of the analysis: its number, the priority between the topmost terminal and the current
+# symbol, the position of the current symbol, and the action, which is 'shift' (of symbol), 'reduce'
+# (of size symbols into symbol), 'end' or 'error'
+Step = namedtuple('Step', 'step, priority, cur, action, size, symbol')
 PRIORITY_SYM = ('=', '>', '<')
 
 
@@ -13,6 +19,14 @@ class OPGEngine:
         self.V_t = set()
         self.identifier = ''
         self.priority_tab = dict()
+        self.reductions = dict()  # normalized right side -> left side of the first rule with it
+        self.first_vt = dict()  # nonterminal -> FIRSTVT, filled by calc_priority_tab
+        self.last_vt = dict()
+        self.representation = 'table'  # or 'functions' once calc_precedence_functions found them
+        self.table_bytes = 0  # size of the priority table the functions replaced
+        self.terminal_ids = dict()  # terminal -> its index in f and g
+        self.f = array('i')  # precedence functions, f[a] > g[b] if a > b and so on
+        self.g = array('i')
 
     def import_rules(self, raw_rules):
         for rule in raw_rules:
@@ -27,52 +41,55 @@ class OPGEngine:
         for v in self.V:
             if v not in self.V_n:
                 self.V_t.add(v)
+        self.reductions = dict()
+        for rule in self.rules:
+            self.reductions.setdefault(self.normalize(rule.right), rule.left)
+
+    def calc_vt(self, last=False):
+        """ FIRSTVT of every nonterminal, or LASTVT if last is set, as a dict of sets of terminals
+        Rules are indexed by their first (last) symbol, so adding b to the set of v only visits the
+        rules beginning (ending) with v, whose left side must then get b as well.
+        """
+        p0, p1 = (-1, -2) if last else (0, 1)
+        vt = {v: set() for v in self.V_n}
+        lefts = dict()  # symbol -> left sides of the rules beginning (ending) with it
+        todo = []
+
+        def insert(u, b):
+            if b not in vt[u]:
+                vt[u].add(b)
+                todo.append((u, b))
+
+        for rule in self.rules:
+            right = rule.right
+            if not right:
+                continue
+            lefts.setdefault(right[p0], set()).add(rule.left)
+            if right[p0] in self.V_t:
+                insert(rule.left, right[p0])
+            elif len(right) >= 2 and right[p1] in self.V_t:
+                insert(rule.left, right[p1])
+        while todo:
+            v, b = todo.pop()
+            for u in lefts.get(v, ()):
+                insert(u, b)
+        return vt
 
-    def calc_priority_tab(self):
+    def calc_priority_tab(self, out=None):
         # tab[v1][v2]
         # 1   :   >
         # -1  :   <
         # 0   :   =
         # ?   :   ?
 
-        def calc_f(flag):  # calculate FIRSTVT(flag==0) and LASTVT(flag!=0)
-            stack = deque()
-            F = []
-
-            def insert(u, b):
-                if (u, b) not in F:
-                    F.append((u, b))
-                    stack.append((u, b))
-
-            if flag == 0:  # FIRST
-                p0, p1 = 0, 1
-            else:  # LAST
-                p0, p1 = -1, -2
-            for rule in self.rules:
-                b = None
-                if rule.right[p0] in self.V_t:
-                    b = rule.right[p0]
-                if len(rule.right) >= 2 and rule.right[p0] in self.V_n and rule.right[p1] in self.V_t:
-                    b = rule.right[p1]
-                if b:
-                    insert(rule.left, b)
-                while len(stack) > 0:
-                    v, b = stack.pop()
-                    for rule in self.rules:
-                        if rule.right[p0] == v:
-                            insert(rule.left, b)
-            return F
-
         def insert(container, key, element):
             if key in container and container[key] != element:
                 raise Exception('Not OPG')
             else:
                 container[key] = element
 
-        first_vt = calc_f(0)
-        last_vt = calc_f(1)
-        # print(first_vt)
-        # print(last_vt)
+        self.first_vt = self.calc_vt()
+        self.last_vt = self.calc_vt(last=True)
         try:
             for rule in self.rules:
                 right = rule.right
@@ -82,25 +99,119 @@ class OPGEngine:
                     if i < len(right)-2 and right[i] in self.V_t and right[i+1] in self.V_n and right[i+2] in self.V_t:
                         insert(self.priority_tab, (right[i], right[i+2]), 0)
                     if right[i] in self.V_t and right[i+1] in self.V_n:
-                        for x, b in first_vt:
-                            if x == right[i+1]:
-                                insert(self.priority_tab, (right[i], b), -1)
+                        for b in self.first_vt[right[i+1]]:
+                            insert(self.priority_tab, (right[i], b), -1)
                     if right[i] in self.V_n and right[i+1] in self.V_t:
-                        for x, a in last_vt:
-                            if x == right[i]:
-                                insert(self.priority_tab, (a, right[i+1]), 1)
+                        for a in self.last_vt[right[i]]:
+                            insert(self.priority_tab, (a, right[i+1]), 1)
             return True
         except Exception:
-            print('Not OPG')
+            print('Not OPG', file=out or sys.stdout)
             return False
 
-    def print_priority_tab(self):
-        print(' \t', end='')
+    def calc_precedence_functions(self):
+        """ Derive Floyd's precedence functions f and g from the priority table, so that the analysis
+        compares two integers instead of looking up a pair of terminals
+        f_a and g_b are merged when a = b, and a > b (a < b) gives an edge from f_a to g_b (g_b to
+        f_a). The functions exist iff the graph has no cycle, and are then the lengths of the longest
+        paths from each node. Returns False, keeping the table, if there is a cycle, otherwise the
+        table is dropped and the analysis uses the functions only.
+        The functions give a relation for every pair, also where the table is blank, so the analysis
+        does not stop at a blank entry. It goes on with the relation the functions give, which may
+        end in an error later or in accepting a program the table rejects.
+        """
+        terminals = sorted(self.V_t)
+        ids = {a: i for i, a in enumerate(terminals)}
+        n = len(terminals)
+        group = list(range(2*n))  # f_a is node ids[a], g_b is node n + ids[b]
+
+        def find(u):
+            while group[u] != u:
+                group[u] = group[group[u]]
+                u = group[u]
+            return u
+
+        for (a, b), priority in self.priority_tab.items():
+            if priority == 0:
+                group[find(ids[a])] = find(n + ids[b])
+        edges = {find(u): set() for u in range(2*n)}
+        for (a, b), priority in self.priority_tab.items():
+            if priority == 1:
+                edges[find(ids[a])].add(find(n + ids[b]))
+            elif priority == -1:
+                edges[find(n + ids[b])].add(find(ids[a]))
+        # topological order, the nodes left out are on or behind a cycle
+        indegree = dict.fromkeys(edges, 0)
+        for u in edges:
+            for v in edges[u]:
+                indegree[v] += 1
+        order = [u for u in edges if indegree[u] == 0]
+        for u in order:
+            for v in edges[u]:
+                indegree[v] -= 1
+                if indegree[v] == 0:
+                    order.append(v)
+        if len(order) < len(edges):
+            self.representation = 'table'
+            return False
+        length = dict()
+        for u in reversed(order):
+            length[u] = max((length[v] + 1 for v in edges[u]), default=0)
+        self.terminal_ids = ids
+        self.f = array('i', (length[find(i)] for i in range(n)))
+        self.g = array('i', (length[find(n + i)] for i in range(n)))
+        self.table_bytes = self._table_bytes()
+        self.priority_tab = dict()
+        self.representation = 'functions'
+        return True
+
+    def _table_bytes(self):
+        return sys.getsizeof(self.priority_tab) + sum(sys.getsizeof(key) for key in self.priority_tab)
+
+    def memory(self):
+        """ Representation used by the analysis and the bytes taken by the table and by the functions
+        With the functions, table_bytes is the size of the table they replaced and saved_bytes the
+        difference, with the table nothing is saved.
+        """
+        if self.representation == 'functions':
+            table = self.table_bytes
+            functions = sys.getsizeof(self.terminal_ids) + sys.getsizeof(self.f) + sys.getsizeof(self.g)
+            saved = table - functions
+        else:
+            table = self._table_bytes()
+            functions = 0
+            saved = 0
+        return {'representation': self.representation, 'table_bytes': table, 'functions_bytes': functions,
+                'saved_bytes': saved}
+
+    def relation(self):
+        """ Function of two terminals giving their priority (1, -1, 0, or None if there is none), from
+        the precedence functions or the table, whichever is used
+        """
+        if self.representation == 'functions':
+            f, g, ids = self.f, self.g, self.terminal_ids
+
+            def priority(a, b):
+                j = ids.get(b)
+                if j is None:
+                    return None
+                d = f[ids[a]] - g[j]
+                return 1 if d > 0 else -1 if d < 0 else 0
+            return priority
+        table = self.priority_tab
+
+        def priority(a, b):
+            return table.get((a, b))
+        return priority
+
+    def print_priority_tab(self, out=None):
+        out = out or sys.stdout
+        print(' \t', end='', file=out)
         for v2 in self.V_t:
-            print('{}\t'.format(v2), end='')
-        print()
+            print('{}\t'.format(v2), end='', file=out)
+        print(file=out)
         for v1 in self.V_t:
-            print('{}\t'.format(v1), end='')
+            print('{}\t'.format(v1), end='', file=out)
             for v2 in self.V_t:
                 priority = self.priority_tab.get((v1, v2))
                 if priority == 0:
@@ -111,78 +222,115 @@ class OPGEngine:
                     sym = '<'
                 else:
                     sym = '?'
-                print('{}\t'.format(sym), end='')
-            print()
+                print('{}\t'.format(sym), end='', file=out)
+            print(file=out)
+
+    def normalize(self, symbols):
+        """ symbols with every nonterminal replaced by $, as reductions do not depend on nonterminals
+        """
+        return ''.join('$' if v in self.V_n else v for v in symbols)
+
+    def accepts(self, program):
+        """ Whether program is accepted, without building the trace
+        """
+        for step in self._steps(program):
+            pass
+        return step.action == 'end'
+
+    def analyse(self, program, out=None, start=0, count=None):
+        """ Print the trace of the analysis of program, or only count lines of it from line start
+        """
+        out = out or sys.stdout
+        for line in islice(self.trace(program), start, None if count is None else start + count):
+            print(line, file=out)
 
-    def analyse(self, program):
+    def trace(self, program):
+        """ Lines of the trace of the analysis of program, generated as they are consumed
+        """
         template = \
             '{step:>4}    {stack:{program_length}}    {priority:^8}    {cur_sym:^7}    {remaining:{program_length}}'\
             .replace('{program_length}', str(max(8, len(program))))
+        stack = []  # copy of the stack of the analysis, rebuilt from its steps
+
+        yield template.format(step='STEP', stack='STACK', priority='PRIORITY', cur_sym='CUR_SYM', remaining='REMAINS')
+        for step in self._steps(program):
+            if step.action == 'end':
+                yield template.format(step=step.step, stack=''.join(stack), priority='END', cur_sym='', remaining='')
+                break
+            yield template.format(
+                step=step.step,
+                stack=''.join(stack),
+                priority='?' if step.priority is None else PRIORITY_SYM[step.priority],
+                cur_sym=program[step.cur] if step.cur < len(program) else '',
+                remaining=program[min(len(program), step.cur+1):])
+            if step.action == 'error':
+                yield 'Error at {}'.format(step.cur)
+            elif step.action == 'shift':
+                stack.append(step.symbol)
+            else:
+                del stack[len(stack)-step.size:]
+                stack.append(step.symbol)
+
+    def _steps(self, program):
+        """ Run the analysis of program, yielding a Step for each step
+        The topmost terminal is found through the positions of the terminals in the stack, and
+        handles are reduced through the index of normalized right sides, so each step takes constant
+        time apart from the symbols it pops. Priorities come from relation().
+        """
+        relation = self.relation()
         stack = []
+        terminals = []  # positions of the terminals in stack
+        unit = set()  # lefts of the reductions of a single symbol since the last shift
         cur = 0
         step = 0
-
-        def error():
-            print('Error at {}'.format(cur))
-
-        def reduce(seg):
-            seg = ''.join([*map(lambda x: '$' if x in self.V_n else x, seg)])
-            for rule in self.rules:
-                right = ''.join([*map(lambda x: '$' if x in self.V_n else x, rule.right)])
-                if seg == right:
-                    return rule.left
-
-        print(template.format(step='STEP', stack='STACK', priority='PRIORITY', cur_sym='CUR_SYM', remaining='REMAINS'))
         while cur <= len(program):
             step += 1
             if len(stack) == 1 and stack[-1] == self.identifier and cur == len(program):
                 # entire program is treated, stack has only one identifier
-                print(template.format(step=step, stack=''.join(stack), priority='END', cur_sym='', remaining=''))
-                break
+                yield Step(step, None, cur, 'end', 0, None)
+                return
             if cur == len(program):
                 cur_sym = ''
                 priority = 1
             else:
-                priority = -1
                 cur_sym = program[cur]
-                for i in range(len(stack)-1, -1, -1):
-                    if stack[i] in self.V_t:
-                        priority = self.priority_tab.get((stack[i], cur_sym))
-                        break
-
-            print(template.format(
-                step=step,
-                stack=''.join(stack),
-                priority='?' if priority is None else PRIORITY_SYM[priority],
-                cur_sym=cur_sym,
-                remaining=program[min(len(program), cur+1):]))
+                priority = relation(stack[terminals[-1]], cur_sym) if terminals else -1
 
             if priority == 1:
-                t = ''
+                handle = []
                 a = None
                 # find the string that is to reduce
-                while True:
-                    if stack[-1] in self.V_t:
-                        if a and self.priority_tab.get((stack[-1], a)) == -1:
+                while stack:
+                    if terminals and terminals[-1] == len(stack)-1:
+                        if a and relation(stack[-1], a) == -1:
                             break
-                        else:
-                            a = stack[-1]
-                    t += stack.pop()
-                    if len(stack) == 0:
-                        break
-                t = t[::-1]
-                reduced = reduce(t)
-                if reduced:
-                    stack.append(reduce(t))
+                        a = stack[-1]
+                        terminals.pop()
+                    handle.append(stack.pop())
+                left = self.reductions.get(self.normalize(reversed(handle))) if handle else None
+                if len(handle) == 1:
+                    if left in unit:  # reducing the same symbol forever
+                        left = None
+                    unit.add(left)
                 else:
-                    error()
-                    break
+                    unit.clear()
+                if left is None:
+                    yield Step(step, priority, cur, 'error', 0, None)
+                    return
+                yield Step(step, priority, cur, 'reduce', len(handle), left)
+                stack.append(left)
+                if left in self.V_t:
+                    terminals.append(len(stack)-1)
             elif priority == 0 or priority == -1:
+                yield Step(step, priority, cur, 'shift', 1, cur_sym)
                 stack.append(cur_sym)
+                if cur_sym in self.V_t:
+                    terminals.append(len(stack)-1)
+                unit.clear()
                 cur += 1
             else:
-                error()
-                break
+                yield Step(step, priority, cur, 'error', 0, None)
+                return
 
 
 def main():
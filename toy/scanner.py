@@ -0,0 +1,376 @@
+""" Scanner generator: compiles a lexicon, a list of (name, regex), into a minimized DFA and scans text
+with it, taking the longest match at each position and the first token of the lexicon on ties
+Regexes support | * + ? {m} {m,} {m,n}, groups, (?: groups, classes like [^a-z], . and the escapes
+\\d \\w \\s \\D \\W \\S \\n \\t \\r \\f \\v, where \\d \\w \\s are ASCII only. Anything else escaped is literal.
+Repetition counts and the sizes of the automata are limited, a lexicon over a limit raises ValueError.
+"""
+from bisect import bisect_right
+
+MAX_CHAR = 0x10ffff
+DIGITS = [(48, 57)]
+WORDS = [(48, 57), (65, 90), (95, 95), (97, 122)]
+SPACES = [(9, 13), (32, 32)]
+MAX_REPEAT = 255  # the largest count of {m,n}
+MAX_NFA_STATES = 50000
+MAX_DFA_STATES = 5000
+MAX_TRANSITIONS = 250000  # DFA states times character classes
+MAX_MOVES = 1000000  # NFA moves, on epsilon or not, followed while building the DFA
+MAX_REFINEMENT = 10000000  # transitions compared while minimizing the DFA
+
+
+def complement(intervals):
+    result = []
+    lo = 0
+    for a, b in sorted(intervals):
+        if a > lo:
+            result.append((lo, a - 1))
+        lo = max(lo, b + 1)
+    if lo <= MAX_CHAR:
+        result.append((lo, MAX_CHAR))
+    return result
+
+
+class RegexParser:
+    """ Parses a regex into a tree of tuples: ('set', intervals), ('cat', items), ('alt', items),
+    ('rep', item, min, max) where max is None for no limit
+    """
+    escapes = {
+        'd': DIGITS, 'w': WORDS, 's': SPACES,
+        'D': complement(DIGITS), 'W': complement(WORDS), 'S': complement(SPACES),
+    }
+    controls = {'n': '\n', 't': '\t', 'r': '\r', 'f': '\f', 'v': '\v'}
+
+    def __init__(self, pattern):
+        self.pattern = pattern
+        self.pos = 0
+
+    def parse(self):
+        tree = self.alternation()
+        if self.pos < len(self.pattern):
+            self.error('Unbalanced )')
+        return tree
+
+    def error(self, message):
+        raise ValueError('{} at {} in {!r}'.format(message, self.pos, self.pattern))
+
+    def peek(self):
+        return self.pattern[self.pos] if self.pos < len(self.pattern) else ''
+
+    def next(self):
+        c = self.peek()
+        if not c:
+            self.error('Unexpected end')
+        self.pos += 1
+        return c
+
+    def alternation(self):
+        items = [self.concatenation()]
+        while self.peek() == '|':
+            self.pos += 1
+            items.append(self.concatenation())
+        return items[0] if len(items) == 1 else ('alt', items)
+
+    def concatenation(self):
+        items = []
+        while self.peek() not in ('', '|', ')'):
+            items.append(self.repetition())
+        return items[0] if len(items) == 1 else ('cat', items)
+
+    def repetition(self):
+        item = self.atom()
+        while True:
+            c = self.peek()
+            if c == '*':
+                item = ('rep', item, 0, None)
+            elif c == '+':
+                item = ('rep', item, 1, None)
+            elif c == '?':
+                item = ('rep', item, 0, 1)
+            elif c == '{':
+                self.pos += 1
+                item = ('rep', item) + self.bounds()
+                continue
+            else:
+                return item
+            self.pos += 1
+
+    def bounds(self):
+        end = self.pattern.find('}', self.pos)
+        if end < 0:
+            self.error('Unterminated {')
+        low, comma, high = self.pattern[self.pos:end].partition(',')
+        try:
+            low = int(low)
+            high = (int(high) if high.strip() else None) if comma else low
+        except ValueError:
+            self.error('Bad repetition')
+        if high is not None and high < low:
+            self.error('Bad repetition')
+        if max(low, high or 0) > MAX_REPEAT:
+            self.error('Repetition count over %d' % MAX_REPEAT)
+        self.pos = end + 1
+        return low, high
+
+    def atom(self):
+        c = self.next()
+        if c == '(':
+            if self.pattern.startswith('?:', self.pos):
+                self.pos += 2
+            item = self.alternation()
+            if self.next() != ')':
+                self.error('Missing )')
+            return item
+        if c == '[':
+            return ('set', self.char_class())
+        if c == '.':
+            return ('set', complement([(10, 10)]))
+        if c == '\\':
+            return ('set', self.escape())
+        if c in '*+?{':
+            self.error('Nothing to repeat')
+        return ('set', [(ord(c), ord(c))])
+
+    def escape(self):
+        c = self.next()
+        if c in self.escapes:
+            return self.escapes[c]
+        c = self.controls.get(c, c)
+        return [(ord(c), ord(c))]
+
+    def char_class(self):
+        negate = self.peek() == '^'
+        if negate:
+            self.pos += 1
+        intervals = []
+        first = True
+        while first or self.peek() != ']':
+            first = False
+            c = self.next()
+            if c == '\\':
+                members = self.escape()
+            else:
+                members = [(ord(c), ord(c))]
+            if len(members) == 1 and members[0][0] == members[0][1] and self.peek() == '-' \
+                    and self.pattern[self.pos + 1:self.pos + 2] not in ('', ']'):
+                self.pos += 1
+                c = self.next()
+                high = self.escape() if c == '\\' else [(ord(c), ord(c))]
+                if len(high) != 1 or high[0][0] < members[0][0]:
+                    self.error('Bad range')
+                members = [(members[0][0], high[0][0])]
+            intervals += members
+        self.pos += 1
+        return complement(intervals) if negate else intervals
+
+
+class Scanner:
+    """ A minimized DFA recognizing the tokens of a lexicon
+    Characters are mapped to classes by the boundaries of the character sets of the lexicon, and
+    transitions[state * class_count + class] is the next state, or -1. accept[state] is the index in
+    names of the token a state accepts, or -1.
+    """
+    def __init__(self, lexicon):
+        self.names = [name for name, pattern in lexicon]
+        trees = [RegexParser(pattern).parse() for name, pattern in lexicon]
+        boundaries = set()
+        for tree in trees:
+            self._boundaries(tree, boundaries)
+        self.boundaries = sorted(boundaries)
+        self.class_count = len(self.boundaries) + 1
+        self.ascii = [bisect_right(self.boundaries, c) for c in range(128)]
+        states, accept = self._determinize(*self._nfa(trees))
+        self.start, self.transitions, self.accept = self._minimize(states, accept)
+
+    def _boundaries(self, tree, boundaries):
+        if tree[0] == 'set':
+            for lo, hi in tree[1]:
+                boundaries.add(lo)
+                boundaries.add(hi + 1)
+        elif tree[0] == 'rep':
+            self._boundaries(tree[1], boundaries)
+        else:
+            for item in tree[1]:
+                self._boundaries(item, boundaries)
+
+    def _nfa(self, trees):
+        """ Thompson's construction, returns (start, epsilon, moves, finals), moves[s] being a list of
+        (first class, last class, target) and finals the final state of each token
+        """
+        epsilon = []
+        moves = []
+
+        def state():
+            if len(epsilon) == MAX_NFA_STATES:
+                raise ValueError('Lexicon too large, over %d NFA states' % MAX_NFA_STATES)
+            epsilon.append([])
+            moves.append([])
+            return len(epsilon) - 1
+
+        def build(tree):
+            start = state()
+            if tree[0] == 'set':
+                end = state()
+                for lo, hi in tree[1]:
+                    moves[start].append((bisect_right(self.boundaries, lo),
+                                         bisect_right(self.boundaries, hi), end))
+            elif tree[0] == 'cat':
+                end = start
+                for item in tree[1]:
+                    s, e = build(item)
+                    epsilon[end].append(s)
+                    end = e
+            elif tree[0] == 'alt':
+                end = state()
+                for item in tree[1]:
+                    s, e = build(item)
+                    epsilon[start].append(s)
+                    epsilon[e].append(end)
+            else:
+                item, low, high = tree[1:]
+                end = start
+                for i in range(low):
+                    s, e = build(item)
+                    epsilon[end].append(s)
+                    end = e
+                if high is None:
+                    s, e = build(item)
+                    last = state()
+                    epsilon[end] += [s, last]
+                    epsilon[e] += [s, last]
+                    end = last
+                else:
+                    last = state()
+                    for i in range(high - low):
+                        s, e = build(item)
+                        epsilon[end].append(s)
+                        epsilon[end].append(last)
+                        end = e
+                    epsilon[end].append(last)
+                    end = last
+            return start, end
+
+        start = state()
+        finals = []
+        for tree in trees:
+            s, e = build(tree)
+            epsilon[start].append(s)
+            finals.append(e)
+        return start, epsilon, moves, finals
+
+    def _determinize(self, start, epsilon, moves, finals):
+        """ Subset construction, returns the transitions of each DFA state and the token it accepts
+        """
+        token_of = {final: i for i, final in enumerate(finals)}
+        work = 0
+
+        def count(moves):
+            nonlocal work
+            work += moves
+            if work > MAX_MOVES:
+                raise ValueError('Lexicon too large, over %d NFA moves' % MAX_MOVES)
+
+        def closure(nfa_states):
+            result = set(nfa_states)
+            todo = list(nfa_states)
+            while todo:
+                s = todo.pop()
+                count(len(epsilon[s]))
+                for t in epsilon[s]:
+                    if t not in result:
+                        result.add(t)
+                        todo.append(t)
+            return frozenset(result)
+
+        closures = dict()  # closure of each set of move targets, the same sets come up in many states
+        first = closure([start])
+        index = {first: 0}
+        sets = [first]
+        states = []
+        accept = []
+        for current in sets:
+            targets = dict()  # class -> NFA states moved to, for the classes with moves
+            for s in current:
+                count(len(moves[s]))
+                for lo, hi, t in moves[s]:
+                    for c in range(lo, hi + 1):
+                        if c in targets:
+                            targets[c].add(t)
+                        else:
+                            targets[c] = {t}
+            row = [-1] * self.class_count
+            for c in sorted(targets):
+                key = frozenset(targets[c])
+                target = closures.get(key)
+                if target is None:
+                    target = closures[key] = closure(key)
+                if target not in index:
+                    if len(sets) == MAX_DFA_STATES:
+                        raise ValueError('Lexicon too large, over %d DFA states' % MAX_DFA_STATES)
+                    if (len(sets) + 1) * self.class_count > MAX_TRANSITIONS:
+                        raise ValueError('Lexicon too large, over %d DFA transitions' % MAX_TRANSITIONS)
+                    index[target] = len(sets)
+                    sets.append(target)
+                row[c] = index[target]
+            states.append(row)
+            accept.append(min((token_of[s] for s in current if s in token_of), default=-1))
+        return states, accept
+
+    def _minimize(self, states, accept):
+        """ Moore's partition refinement, states start apart by the token they accept
+        Returns (start, transitions, accept) of the minimized DFA.
+        """
+        block = accept + [-2]  # block[-1] is the block of the missing transitions
+        count = len(set(accept))
+        work = 0
+        while True:
+            work += len(states) * self.class_count
+            if work > MAX_REFINEMENT:
+                raise ValueError('Lexicon too large, over %d transitions compared' % MAX_REFINEMENT)
+            signatures = dict()
+            refined = []
+            for s, row in enumerate(states):
+                signature = (block[s], *map(block.__getitem__, row))
+                refined.append(signatures.setdefault(signature, len(signatures)))
+            refined.append(-2)
+            block = refined
+            if len(signatures) == count:
+                break
+            count = len(signatures)
+        transitions = [-1] * (count * self.class_count)
+        accepted = [-1] * count
+        for s, row in enumerate(states):
+            base = block[s] * self.class_count
+            for c, t in enumerate(row):
+                transitions[base + c] = block[t] if t >= 0 else -1
+            accepted[block[s]] = accept[s]
+        return block[0], transitions, accepted
+
+    def char_class(self, c):
+        o = ord(c)
+        return self.ascii[o] if o < 128 else bisect_right(self.boundaries, o)
+
+    def tokens(self, text, pos=0):
+        """ Yield (name, start, end) of each token of text from pos, then (None, start, start) and
+        stop if no token matches at start
+        """
+        transitions, accept, ascii, k = self.transitions, self.accept, self.ascii, self.class_count
+        n = len(text)
+        while pos < n:
+            state = self.start
+            token = -1
+            end = pos
+            i = pos
+            while i < n:
+                o = ord(text[i])
+                state = transitions[state * k + (ascii[o] if o < 128 else bisect_right(self.boundaries, o))]
+                if state < 0:
+                    break
+                i += 1
+                if accept[state] >= 0:
+                    token = accept[state]
+                    end = i
+            if token < 0 or end == pos:
+                yield None, pos, pos
+                return
+            yield self.names[token], pos, end
+            pos = end
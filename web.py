@@ -1,26 +1,179 @@
-from contextlib import redirect_stdout, redirect_stderr
 from io import StringIO
 from flask import Flask
 from flask import render_template
 from flask import request
 from flask import jsonify
+from flask import Response
 from toy import lexer, opg
 from compiler.parser import Parser, OpCode, PCode
-from compiler.interpreter import Interpreter
+from compiler import pcode
+from compiler.interpreter import engines
 from compiler.exceptions import *
-import sys
-import subprocess
-import os
+from compiler.utilities import LRUCache, SessionStore
+from compiler.sandbox import Sandbox, run_batch
+from compiler.profiler import profile
+import hashlib
+import json
 
 
 app = Flask(__name__)
 
 PORT = 4000
 
-os.chdir(r'D:\MyProjects\CompilerLabOnline')
-
 lexer_engine = lexer.LexerEngine()
 
+# compiled PL/0 programs and parsed p-code listings, by hash of their normalized text
+compile_cache = LRUCache(256)
+
+# lexer engines of custom lexicons, by hash of their text, so their DFA is built once
+lexicon_cache = LRUCache(64)
+
+# OPG engines of grammars with their priority table listings, by hash of the normalized rules
+grammar_cache = LRUCache(64)
+
+# limits of programs run by /api/v1/interpreter
+limits = dict(max_steps=10000000, max_stack=1000000, max_time=5.0)
+
+# interactive programs waiting for input, by session id
+sessions = SessionStore(max_size=1024, max_idle=600.0)
+
+# lines of the OPG analysis trace returned at once, see the start and count fields of /api/v1/opg
+TRACE_LINES = 1000
+
+# bytes of output /api/v1/interpreter/stream sends before stopping the program
+STREAM_OUTPUT_LIMIT = 1 << 20
+
+# runs programs for /api/v1/compiler in worker processes with time and instruction limits
+sandbox = Sandbox(max_workers=4, timeout=5.0, max_steps=10000000, max_stack=1000000)
+
+
+def source_key(kind, text):
+    text = text.replace('\r\n', '\n').strip()
+    return text, hashlib.sha1(('%s\n%s' % (kind, text)).encode()).hexdigest()
+
+
+def compile_source(program, opt_level=0):
+    """ Compile PL/0 source, returns (pcodes, listing, errors, lines, procedures) where pcodes is None
+    if there are errors, lines is the source line of each pcode and procedures the parser's records
+    """
+    program, key = source_key('pl0 %d' % opt_level, program)
+    result = compile_cache.get(key)
+    if result is None:
+        s = StringIO()
+        t = StringIO()
+        parser = Parser(opt_level=opt_level)
+        parser.load_program(program)
+        pcodes = parser.analyze(out=s, err=t)
+        result = (pcodes, s.getvalue(), t.getvalue(), parser.pcode.lines, parser.procedures)
+        compile_cache.put(key, result)
+    return result
+
+
+def load_lexer(text):
+    """ Lexer engine of a lexicon written one token per line as its name and regex, or of the PL/0
+    lexicon if text is blank. Raises ValueError if a regex is wrong.
+    """
+    text, key = source_key('lexicon', text)
+    if not text:
+        return lexer_engine
+    engine = lexicon_cache.get(key)
+    if engine is None:
+        engine = lexer.LexerEngine(lexer.parse_lexicon(text))
+        lexicon_cache.put(key, engine)
+    return engine
+
+
+def load_grammar(grammar, functions=False):
+    """ OPG engine of a grammar, returns (engine, listing) where listing is the printed priority table,
+    or 'Not OPG' and engine None if the grammar is not an operator precedence grammar
+    If functions is set, the engine analyses with precedence functions when the grammar has them,
+    and the listing tells which representation is used. The functions do not detect the blank
+    entries of the table, so they may accept programs the table rejects.
+    Blank lines are dropped and line ends normalized, other whitespace is kept as it makes symbols.
+    Cached engines are shared, which is safe as the analysis does not change them.
+    """
+    raw_rules = [rule for rule in grammar.replace('\r', '').split('\n') if rule]
+    key = hashlib.sha1(('opg %d\n%s' % (functions, '\n'.join(raw_rules))).encode()).hexdigest()
+    result = grammar_cache.get(key)
+    if result is None:
+        s = StringIO()
+        opg_engine = opg.OPGEngine()
+        opg_engine.import_rules(raw_rules)
+        if opg_engine.calc_priority_tab(out=s):
+            opg_engine.print_priority_tab(out=s)
+            print(file=s)
+            if functions:
+                if opg_engine.calc_precedence_functions():
+                    memory = opg_engine.memory()
+                    print('Precedence functions, {} bytes instead of {}, blank entries are not errors'.format(
+                        memory['functions_bytes'], memory['table_bytes']), file=s)
+                    ids = opg_engine.terminal_ids
+                    for name, values in (('f', opg_engine.f), ('g', opg_engine.g)):  # in the columns' order
+                        print(name + '\t' + ''.join('{}\t'.format(values[ids[v]]) for v in opg_engine.V_t), file=s)
+                else:
+                    print('No precedence functions, the priority table is used', file=s)
+                print(file=s)
+        else:
+            opg_engine = None
+        result = (opg_engine, s.getvalue())
+        grammar_cache.put(key, result)
+    return result
+
+
+def compile_program(program, opt_level=0):
+    """ Compile PL/0 source, returns (pcodes, listing, errors) where pcodes is None if there are errors
+    """
+    return compile_source(program, opt_level)[:3]
+
+
+def load_pcodes(program):
+    """ Parse a p-code listing, returns (pcodes, error)
+    """
+    program, key = source_key('pcode', program)
+    result = compile_cache.get(key)
+    if result is None:
+        pcodes = []
+        error = ''
+        ln = 0
+        try:
+            for line in program.split('\n'):
+                ln += 1
+                if line.startswith('#'):  # comments such as the optimizer report
+                    continue
+                line = line.strip(' \r()')
+                pieces = line.split(',')
+                pcodes.append(PCode(OpCode[pieces[0].strip()], int(pieces[1].strip()), int(pieces[2].strip())))
+        except Exception:
+            error = 'Unexpected p-code at %d\n' % ln
+        result = (pcodes, error)
+        compile_cache.put(key, result)
+    return result
+
+
+def load_binary(data):
+    """ Load a binary p-code file, returns (pcodes, error)
+    """
+    key = hashlib.sha1(b'binary\n' + data).hexdigest()
+    result = compile_cache.get(key)
+    if result is None:
+        try:
+            result = (pcode.loads(data), '')
+        except ValueError as e:
+            result = ([], '%s\n' % e)
+        compile_cache.put(key, result)
+    return result
+
+
+def load_engine(name, batch=False):
+    """ The interpreter class of an engine by name, returns (engine, error)
+    With batch, 'lockstep' is an engine too and gives None, see compiler.sandbox.run_batch.
+    """
+    if batch and name == 'lockstep':
+        return None, ''
+    if name not in engines:
+        return None, 'Unknown engine %s\n' % name
+    return engines[name], ''
+
 
 # @app.route("/")
 @app.route("/lexer")
@@ -51,83 +204,199 @@ def show_compiler():
 
 @app.route("/api/v1/lexer", methods=['POST'])
 def api_lexer():
+    try:
+        engine = load_lexer(request.form.get('lexicon', ''))
+    except ValueError as e:
+        return 'Lexicon error: {}\n'.format(e)
     s = StringIO()
-    with redirect_stdout(s):
-        lexer_engine.process(request.form['code'])
+    engine.process(request.form['code'], out=s)
     return s.getvalue()
 
 
 @app.route("/api/v1/opg", methods=['POST'])
 def api_opg():
+    opg_engine, listing = load_grammar(request.form['grammar'], request.form.get('functions', '0') == '1')
+    program = request.form['code'].strip()
     s = StringIO()
-    with redirect_stdout(s):
-        opg_engine = opg.OPGEngine()
-        raw_rules = [*request.form['grammar'].replace('\r', '').split('\n')]
-        program = request.form['code'].strip()
-        opg_engine.import_rules(raw_rules)
-        if opg_engine.calc_priority_tab():
-            opg_engine.print_priority_tab()
-            print()
-            opg_engine.analyse(program)
+    s.write(listing)
+    if opg_engine is not None:
+        if request.form.get('trace', '1') == '0':  # only whether the program is accepted
+            print('Accepted' if opg_engine.accepts(program) else 'Rejected', file=s)
+        else:
+            start = int(request.form.get('start', 0))
+            opg_engine.analyse(program, out=s, start=start, count=int(request.form.get('count', TRACE_LINES)))
     # print(s.getvalue())
     return s.getvalue()
 
 
 @app.route("/api/v1/parser", methods=['POST'])
 def api_parser():
-    s = StringIO()
-    t = StringIO()
-    with redirect_stdout(s), redirect_stderr(t):
-        parser = Parser()
-        program = request.form['code'].strip()
-        parser.load_program(program)
-        parser.analyze()
-    if t.getvalue() != '':
-        return t.getvalue()
+    pcodes, listing, errors = compile_program(request.form['code'], int(request.form.get('opt', 0)))
+    if errors != '':
+        return errors
+    elif request.form.get('format') == 'binary':
+        try:
+            return Response(pcode.dumps(pcodes), mimetype='application/octet-stream')
+        except ValueError as e:
+            return '%s\n' % e
     else:
-        return s.getvalue()
+        return listing
 
 
 @app.route("/api/v1/interpreter", methods=['POST'])
 def api_interpreter():
-    pcodes = []
+    if 'binary' in request.files:  # a compiled program in the binary format
+        pcodes, error = load_binary(request.files['binary'].read())
+    else:
+        pcodes, error = load_pcodes(request.form['code'])
+    if error == '':
+        engine, error = load_engine(request.form.get('engine', 'threaded'))
+    if error != '':
+        return error
     s = StringIO()
     t = StringIO()
-    interpreter = Interpreter()
-    with redirect_stdout(s), redirect_stderr(t):
-        ln = 0
-        program = request.form['code'].strip()
-        interpreter.in_ = request.form['in'].strip().split()
-        try:
-            for line in program.split('\n'):
-                ln += 1
-                line = line.strip(' \r()')
-                pieces = line.split(',')
-                pcodes.append(PCode(OpCode[pieces[0].strip()], int(pieces[1].strip()), int(pieces[2].strip())))
-            interpreter.interpret(pcodes)
-        except Exception:
-            print('Unexpected p-code at %d' % ln, file=sys.stderr)
+    interpreter = engine(**limits)
+    interpreter.in_ = request.form['in'].strip().split()
+    interpreter.interpret(pcodes, out=s, err=t)
     if t.getvalue() != '':
         return t.getvalue()
     else:
         return s.getvalue()
 
 
+@app.route("/api/v1/interpreter/stream", methods=['POST'])
+def api_interpreter_stream():
+    """ Run p-code and send its output as server-sent events while it runs
+    Events are 'out' and 'err' with the text as JSON string data, then 'end'
+    """
+    if 'binary' in request.files:
+        pcodes, error = load_binary(request.files['binary'].read())
+    else:
+        pcodes, error = load_pcodes(request.form['code'])
+    if error == '':
+        engine, error = load_engine(request.form.get('engine', 'threaded'))
+    if error == '':
+        interpreter = engine(**limits)
+        interpreter.in_ = request.form['in'].strip().split()
+
+    def event(kind, text):
+        return 'event: %s\ndata: %s\n\n' % (kind, json.dumps(text))
+
+    def generate():
+        if error != '':
+            yield event('err', error)
+        else:
+            size = 0
+            events = interpreter.stream(pcodes)
+            try:  # closing events stops the program, also when the client goes away
+                for kind, text in events:
+                    size += len(text)
+                    if size > STREAM_OUTPUT_LIMIT:
+                        yield event('err', 'Output limit exceeded\n')
+                        break
+                    yield event(kind, text)
+            finally:
+                events.close()
+        yield event('end', '')
+    return Response(generate(), mimetype='text/event-stream')
+
+
+def session_response(key, interpreter, output, errors):
+    """ Keep the interpreter if its program waits for input, and describe the session
+    """
+    if not interpreter.suspended:
+        key = None
+    elif key:
+        sessions.put(key, interpreter)
+    else:
+        key = sessions.add(interpreter)
+    return jsonify(session=key, waiting=key is not None, output=output, errors=errors)
+
+
+@app.route("/api/v1/session", methods=['POST'])
+def api_session():
+    """ Run p-code interactively, when the program reads and the input has run out, it waits for
+    more to be posted to /api/v1/session/<session>
+    """
+    if 'binary' in request.files:
+        pcodes, error = load_binary(request.files['binary'].read())
+    else:
+        pcodes, error = load_pcodes(request.form['code'])
+    if error == '':
+        engine, error = load_engine(request.form.get('engine', 'threaded'))
+    if error != '':
+        return jsonify(session=None, waiting=False, output='', errors=error)
+    s = StringIO()
+    t = StringIO()
+    interpreter = engine(**limits)
+    interpreter.interactive = True
+    interpreter.in_ = request.form.get('in', '').strip().split()
+    interpreter.interpret(pcodes, out=s, err=t)
+    return session_response(None, interpreter, s.getvalue(), t.getvalue())
+
+
+@app.route("/api/v1/session/<key>", methods=['POST'])
+def api_session_input(key):
+    interpreter = sessions.pop(key)
+    if interpreter is None:
+        return jsonify(session=None, waiting=False, output='', errors='Unknown session\n')
+    s = StringIO()
+    t = StringIO()
+    interpreter.resume(request.form['in'].strip().split(), out=s, err=t)
+    return session_response(key, interpreter, s.getvalue(), t.getvalue())
+
+
 @app.route("/api/v1/compiler", methods=['POST'])
 def api_compiler():
-    program = request.form['code'].strip()
-    with open('test.pl0', 'w+') as f:
-        f.write(program.replace('\r\n', '\n'))
-    p = subprocess.Popen('pl0.exe',
-                         stdin=subprocess.PIPE,
-                         stdout=subprocess.PIPE,
-                         stderr=None,
-                         shell=True,
-                         universal_newlines=True)
-    outs, errs = p.communicate('test.pl0\n'+request.form['in'])
-    # print(outs)
-    return outs
+    pcodes, listing, errors = compile_program(request.form['code'])
+    if errors != '':
+        return errors
+    output, errors = sandbox.run(pcodes, request.form['in'].strip().split())
+    return listing + '\n' + output + errors
+
+
+@app.route("/api/v1/batch", methods=['POST'])
+def api_batch():
+    """ Compile a PL/0 program once and run it on every input string of the JSON list 'inputs'
+    """
+    pcodes, listing, errors = compile_program(request.form['code'], int(request.form.get('opt', 0)))
+    if errors != '':
+        return jsonify(errors=errors, cases=[])
+    try:
+        inputs = json.loads(request.form['inputs'])
+    except ValueError:
+        inputs = None
+    if not isinstance(inputs, list) or not all(isinstance(in_, str) for in_ in inputs):
+        return jsonify(errors='inputs must be a JSON list of strings\n', cases=[]), 400
+    engine = request.form.get('engine', 'threaded')
+    error = load_engine(engine, batch=True)[1]
+    if error != '':
+        return jsonify(errors=error, cases=[]), 400
+    cases = run_batch(pcodes, inputs, engine, **limits)
+    return jsonify(errors='', cases=cases)
+
+
+@app.route("/api/v1/profile", methods=['POST'])
+def api_profile():
+    """ Run a PL/0 program and return its output with execution counts per instruction, kind of
+    instruction, source line and procedure
+    """
+    pcodes, listing, errors, lines, procedures = compile_source(request.form['code'], int(request.form.get('opt', 0)))
+    if errors != '':
+        return jsonify(errors=errors)
+    s = StringIO()
+    t = StringIO()
+    interpreter, result = profile(pcodes, request.form.get('in', '').strip().split(), lines, procedures,
+                                  out=s, err=t, **limits)
+    return jsonify(output=s.getvalue(), errors=t.getvalue(), steps=interpreter.steps, time=interpreter.elapsed,
+                   profile=result.to_dict())
+
+
+@app.route("/api/v1/stats")
+def api_stats():
+    return jsonify(compile_cache=compile_cache.stats(), grammar_cache=grammar_cache.stats(),
+                   lexicon_cache=lexicon_cache.stats())
 
 
 if __name__ == "__main__":
-    app.run(host='0.0.0.0', port=PORT)
+    app.run(host='0.0.0.0', port=PORT, threaded=True)